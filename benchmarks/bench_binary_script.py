@@ -0,0 +1,68 @@
+'''
+Size and load time of script.json against the binary script.
+
+The runtime loads the script on every worker start. script.json is validated by
+pydantic, the binary script of a trusted build is not. Sizes are shown as stored
+and deflated as in build.yab. The best of five runs is shown. Run from the repo root:
+
+    python -m benchmarks.bench_binary_script
+'''
+import time
+import zlib
+
+from yab_parser import builder
+from yab_parser.binary_script import dump_script, load_script
+from yab_parser.schemas.script import Script
+from yab_parser.schemas.settings import ScriptSettings
+from benchmarks.story import make_story
+
+SETTINGS = {
+    'reactions': {'happy': ['Yay']},
+    'tech_messages': {
+        'save_menu_text': 'Save', 'cancel_menu_text': 'Cancel', 'restart_text': 'Restart?',
+        'restart_button_text': 'Restart', 'cancel_button_text': 'No',
+    },
+    'default_settings': {
+        'wait': 1.0, 'time_for_status': 2.0, 'reaction': 'happy',
+        'native_language': 'en', 'languages': {'en': 'English'},
+    },
+}
+
+
+def make_script(nodes: int, line_ids: str) -> Script:
+    story = make_story(nodes, branching=2, lines=5, depth=2)
+    story_file = builder.StoryFile('story.yarn', story.splitlines(keepends=True), line_ids=line_ids)
+    assert not story_file.error_rows, story_file.error_rows[:3]
+    return Script(settings=ScriptSettings(**SETTINGS), start_node='Node0', nodes=story_file.nodes)
+
+
+def best_time(func) -> float:
+    times = []
+    for _ in range(5):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    print(f'{"nodes":>6} {"ids":>8} {"format":>15} {"size":>9} {"deflated":>9} {"load":>10}')
+    for nodes, line_ids in ((200, 'uuid'), (200, 'compact'), (1000, 'compact')):
+        script = make_script(nodes, line_ids)
+        script_json = script.model_dump_json().encode('utf-8')
+        binary_script = dump_script(script)
+        assert load_script(binary_script, trusted=True) == script
+        assert load_script(binary_script) == script
+        for name, content, load in (
+            ('json', script_json, lambda: Script.model_validate_json(script_json)),
+            ('binary', binary_script, lambda: load_script(binary_script)),
+            ('binary trusted', binary_script, lambda: load_script(binary_script, trusted=True)),
+        ):
+            print(
+                f'{nodes:>6} {line_ids:>8} {name:>15} {len(content) / 1024:>6.0f} kB'
+                f' {len(zlib.compress(content)) / 1024:>6.0f} kB {best_time(load) * 1000:>7.1f} ms'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+'''
+Time of YabScriptChecker on stories with many branching nodes.
+
+The number of paths through such stories grows exponentially,
+the dataflow check stays linear in the size of the jump graph. Run from the repo root:
+
+    python -m benchmarks.bench_checker
+'''
+import time
+
+from yab_parser import builder
+from benchmarks.story import make_story
+
+
+def main():
+    print(f'{"nodes":>6} {"branching":>10} {"check":>10}')
+    for nodes_count, branching in ((100, 3), (500, 3), (500, 6), (2000, 4)):
+        story = make_story(nodes_count, branching=branching, lines=1, depth=0)
+        story_file = builder.StoryFile('story.yarn', story.splitlines(keepends=True))
+        start = time.perf_counter()
+        checker = builder.YabScriptChecker([story_file])
+        check_time = time.perf_counter() - start
+        assert not checker.error_rows, checker.error_rows[:3]
+        print(f'{nodes_count:>6} {branching:>10} {check_time * 1000:>7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+Evaluations per second of the conditions of a script.
+
+A consumer without the programs walks the Condition and Expression trees on every
+option shown and every branch, the programs are run by evaluate() or turned into
+closures once by make_evaluator(). The best of five runs is shown. Run from the repo root:
+
+    python -m benchmarks.bench_conditions
+'''
+import operator
+import time
+
+from yab_parser import builder
+from yab_parser.program import evaluate, make_evaluator
+from yab_parser.schemas.script import Condition, ConditionType, Expression, ExpressionType, Var
+
+STORY = '''title: Start
+---
+<<declare $gold = 10>>
+<<declare $level = 3>>
+<<if $gold > 3 and $gold < 100>>
+    Rich
+<<elseif $gold * 2 + $level * (10 - 4) >= 50 - 2 * 5 or not $level == 1>>
+    Strong
+<<elseif $level == 1 xor $gold % 2 == 0 xor $gold > 60 * 60>>
+    Odd
+<<endif>>
+Done
+===
+'''
+EXPRESSION_FUNCTIONS = {
+    ExpressionType.add: operator.add,
+    ExpressionType.subtract: operator.sub,
+    ExpressionType.multiply: operator.mul,
+    ExpressionType.divide: operator.truediv,
+    ExpressionType.modulo: operator.mod,
+}
+COMPARISON_FUNCTIONS = {
+    ConditionType.eq: operator.eq,
+    ConditionType.ne: operator.ne,
+    ConditionType.lt: operator.lt,
+    ConditionType.gt: operator.gt,
+    ConditionType.le: operator.le,
+    ConditionType.ge: operator.ge,
+}
+
+
+def walk(value, variables: dict):
+    if isinstance(value, Var):
+        return variables[value.name]
+    if isinstance(value, Expression):
+        values = [walk(item, variables) for item in value.value]
+        result = values[0]
+        for item in values[1:]:
+            result = EXPRESSION_FUNCTIONS[value.exp_type](result, item)
+        return result
+    if isinstance(value, Condition):
+        values = [walk(item, variables) for item in value.value]
+        if value.cond_type == ConditionType.not_op:
+            return not values[0]
+        if value.cond_type == ConditionType.and_op:
+            return all(values)
+        if value.cond_type == ConditionType.or_op:
+            return any(values)
+        if value.cond_type == ConditionType.xor_op:
+            return sum(map(bool, values)) % 2 == 1
+        return COMPARISON_FUNCTIONS[value.cond_type](*values)
+    return value
+
+
+def best_rate(func, count: int) -> float:
+    times = []
+    for _ in range(5):
+        start = time.perf_counter()
+        func(count)
+        times.append(time.perf_counter() - start)
+    return count / min(times)
+
+
+def main():
+    story_file = builder.StoryFile('story.yarn', STORY.splitlines(keepends=True), line_ids='compact')
+    assert not story_file.error_rows, story_file.error_rows
+    flow_control = story_file.nodes['Start'].flow['2']
+    blocks = [flow_control.if_block] + flow_control.elif_blocks
+    variables = {'$gold': 10, '$level': 3}
+    count = 20000
+    for block in blocks:
+        program = block.program
+        evaluator = make_evaluator(program)
+        assert walk(block.condition, variables) == evaluate(program, variables) == evaluator(variables)
+        print(f'{len(program)} instructions: {program}')
+
+        def run_walk(count):
+            for _ in range(count):
+                walk(block.condition, variables)
+
+        def run_evaluate(count):
+            for _ in range(count):
+                evaluate(program, variables)
+
+        def run_evaluator(count):
+            for _ in range(count):
+                evaluator(variables)
+
+        for name, func in (('tree walk', run_walk), ('evaluate', run_evaluate), ('make_evaluator', run_evaluator)):
+            print(f'{name:>16} {best_rate(func, count):>12,.0f} /s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+Time and peak memory of the script.json extractor against the recursive walker it replaced.
+
+The script is built from a synthetic story and its nodes are copied under new names
+to reach the wanted size. The streaming mode is what scripts over 100 MB use. Run from the repo root:
+
+    python -m benchmarks.bench_extractor
+'''
+import io
+import json
+import time
+import tracemalloc
+
+from yab_parser import builder
+from yab_parser.babel_extractors import extract_yab_json, merge_messages
+from benchmarks.story import make_story
+
+
+SETTINGS = {
+    'reactions': {'happy': ['Yay', 'Cool'], 'sad': ['Oh no']},
+    'tech_messages': {'save_menu_text': 'Save', 'cancel_menu_text': 'Cancel'},
+}
+
+
+def recursive_extract_yab_json(fileobj, keywords, comment_tags, options):
+    content = json.load(fileobj)
+    messages = []
+
+    settings = content.get('settings', {})
+    for key, value in settings.get('reactions', {}).items():
+        if not value:
+            continue
+        messages += [(0, '', item, ['reaction', key]) for item in value]
+    for key, value in settings.get('tech_messages', {}).items():
+        if not value:
+            continue
+        messages.append((0, '', value, ['tech_message', key]))
+
+    def recursive_extract(data, node_name: str, is_option=False):
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if key == 'text':
+                    if not value:
+                        continue
+                    messages.append((0, '', value, [f'node: {node_name}', 'option' if is_option else 'msg']))
+                elif key == 'speaker':
+                    if not value:
+                        continue
+                    messages.append((0, '', value, [f'node: {node_name}', 'speaker_name']))
+                recursive_extract(value, node_name)
+        elif isinstance(data, list):
+            for item in data:
+                recursive_extract(item, node_name, is_option=True)
+
+    for node_name, node in content.get('nodes', {}).items():
+        checkpoint_name = node.get('checkpoint_name')
+        if checkpoint_name:
+            messages.append((0, '', checkpoint_name, ['checkpoint_name', node_name]))
+        recursive_extract(node.get('flow', {}), node_name)
+    return messages
+
+
+def make_script_json(copies: int) -> bytes:
+    story = make_story(50, branching=2, lines=5, depth=2)
+    story_file = builder.StoryFile('story.yarn', story.splitlines(keepends=True), line_ids='compact')
+    assert not story_file.error_rows, story_file.error_rows[:3]
+    nodes = {name: node.model_dump(mode='json') for name, node in story_file.nodes.items()}
+    script = {'settings': SETTINGS, 'start_node': 'Node0', 'nodes': {}}
+    for copy in range(copies):
+        for name, node in nodes.items():
+            script['nodes'][f'{name}_{copy}'] = node
+    return json.dumps(script, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def run(extractor, content: bytes, options: dict) -> tuple[list, float, int]:
+    start = time.perf_counter()
+    messages = extractor(io.BytesIO(content), [], [], options)
+    elapsed = time.perf_counter() - start
+    # Traced separately, tracemalloc slows the extractors down
+    tracemalloc.start()
+    extractor(io.BytesIO(content), [], [], options)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return messages, elapsed, peak
+
+
+def main():
+    print(f'{"size":>9} {"extractor":>10} {"time":>10} {"peak memory":>12} {"messages":>9}')
+    for copies in (1, 10, 50):
+        content = make_script_json(copies)
+        expected = None
+        for name, extractor, options in (
+            ('recursive', recursive_extract_yab_json, {}),
+            ('load', extract_yab_json, {'stream': 'false'}),
+            ('stream', extract_yab_json, {'stream': 'true'}),
+        ):
+            messages, elapsed, peak = run(extractor, content, options)
+            messages = [(message, comments) for _, _, message, comments in messages]
+            if expected is None:
+                expected = merge_messages(messages)
+            else:
+                assert messages == expected, name
+            print(
+                f'{len(content) / 2 ** 20:>6.1f} MB {name:>10} {elapsed * 1000:>7.1f} ms'
+                f' {peak / 2 ** 20:>9.1f} MB {len(messages):>9}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+'''
+Memory and time of a worker that uses a few nodes of a large binary script.
+
+load_script decodes every node, LazyScript maps the file and decodes the nodes
+on first access. The memory is the one Python allocated for the script, the mapped
+file is shared page cache. Run from the repo root:
+
+    python -m benchmarks.bench_lazy_script
+'''
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from yab_parser.binary_script import LazyScript, dump_script, load_script
+from benchmarks.bench_binary_script import make_script
+
+
+def measure(func) -> tuple[float, int]:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    # Traced separately, tracemalloc slows the decoding down
+    tracemalloc.start()
+    result = func()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return elapsed, memory
+
+
+def main():
+    script = make_script(2000, 'compact')
+    node_names = list(script.nodes)
+    path = os.path.join(tempfile.mkdtemp(), 'script.bin')
+    with open(path, 'wb') as f:
+        f.write(dump_script(script))
+    del script
+    print(f'script.bin: {os.path.getsize(path) / 1024:.0f} kB, {len(node_names)} nodes')
+
+    def load_all():
+        with open(path, 'rb') as f:
+            return load_script(f.read(), trusted=True)
+    elapsed, memory = measure(load_all)
+    print(f'{"load_script":>24} {elapsed * 1000:>8.1f} ms {memory / 2 ** 20:>7.1f} MB')
+
+    rng = random.Random(0)
+    for used in (1, 10, 100):
+        names = rng.sample(node_names, used)
+
+        def load_lazy():
+            script = LazyScript.open(path, trusted=True)
+            for name in names:
+                script[name]
+            return script
+        elapsed, memory = measure(load_lazy)
+        print(f'{f"LazyScript, {used} nodes":>24} {elapsed * 1000:>8.1f} ms {memory / 2 ** 20:>7.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
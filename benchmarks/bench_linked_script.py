@@ -0,0 +1,63 @@
+'''
+Load time and line stepping of script.json against the linked script.
+
+script.json is validated by pydantic and its lines are found by their uuid in the
+flow of the node, the linked script is loaded into plain objects and its lines are
+found by position. The stepping follows the next links of every node to the end,
+the way a runtime moves between lines. The best of five runs is shown. Run from the repo root:
+
+    python -m benchmarks.bench_linked_script
+'''
+import zlib
+
+from yab_parser.linked_script import dump_linked_script, load_linked_script
+from yab_parser.schemas.script import Script
+from benchmarks.bench_binary_script import best_time, make_script
+
+ROUNDS = 20
+
+
+def step_script(script: Script) -> int:
+    steps = 0
+    for _ in range(ROUNDS):
+        for node in script.nodes.values():
+            flow = node.flow
+            line = flow.get('')
+            while line is not None:
+                steps += 1
+                line = flow.get(line.next_line_id)
+    return steps
+
+
+def step_linked_script(script) -> int:
+    steps = 0
+    for _ in range(ROUNDS):
+        for node in script.nodes:
+            lines = node.lines
+            line = lines[0] if lines else None
+            while line is not None:
+                steps += 1
+                line = lines[line.next] if line.next is not None else None
+    return steps
+
+
+def main():
+    script = make_script(1000, 'uuid')
+    script_json = script.model_dump_json().encode('utf-8')
+    linked_script = dump_linked_script(script)
+    assert step_script(script) == step_linked_script(load_linked_script(linked_script))
+    print(f'{"format":>8} {"size":>9} {"deflated":>9} {"load":>10} {"step":>10}')
+    for name, content, load, step in (
+        ('json', script_json, lambda: Script.model_validate_json(script_json), step_script),
+        ('linked', linked_script, lambda: load_linked_script(linked_script), step_linked_script),
+    ):
+        loaded = load()
+        steps = step(loaded)
+        print(
+            f'{name:>8} {len(content) / 1024:>6.0f} kB {len(zlib.compress(content)) / 1024:>6.0f} kB'
+            f' {best_time(load) * 1000:>7.1f} ms {best_time(lambda: step(loaded)) / steps * 1e9:>7.0f} ns'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Serialization time per line of deeply nested options and if blocks.
+
+Every level of the nodes holds a few lines and the next level, so the work per
+line should not grow with the depth. The best of five runs is shown. Run from the repo root:
+
+    python -m benchmarks.bench_nesting
+'''
+import copy
+import sys
+import time
+
+from yab_parser import builder, grammar
+
+DEPTHS = [10, 20, 40, 80]
+
+
+def make_nested_rows(depth: int, kind: str) -> list[str]:
+    rows = []
+    for level in range(depth):
+        indent = '    ' * level
+        rows.append(f'{indent}Line at level {level}')
+        if kind == 'options':
+            rows.append(f'{indent}Question at level {level}')
+            rows.append(f'{indent}-> Leave')
+            rows.append(f'{indent}    Left at level {level}')
+            rows.append(f'{indent}-> Go deeper')
+        else:
+            rows.append(f'{indent}<<if $gold > {level}>>')
+    for level in reversed(range(depth)):
+        indent = '    ' * level
+        rows.append(f'{indent}    Deepest of level {level}')
+        if kind == 'ifs':
+            rows.append(f'{indent}<<else>>')
+            rows.append(f'{indent}    Poor at level {level}')
+            rows.append(f'{indent}<<endif>>')
+        rows.append(f'{indent}After level {level}')
+    return rows
+
+
+def make_nested_story(depth: int, kind: str) -> str:
+    rows = ['title: Nested', '---', '<<declare $gold = 10>>']
+    rows += make_nested_rows(depth, kind)
+    rows.append('===')
+    return '\n'.join(rows) + '\n'
+
+
+def main():
+    sys.setrecursionlimit(100_000)
+    parser = grammar.get_yarn_parser()
+    print(f'{"kind":>8} {"depth":>6} {"lines":>6} {"serialize":>12} {"per line":>12}')
+    for kind in ('options', 'ifs'):
+        for depth in DEPTHS:
+            visitor = builder.NodesVisitor()
+            visitor.visit(parser.parse(make_nested_story(depth, kind)))
+            node = builder.TgTransformer().transform(visitor.all_nodes['Nested'])
+            best = float('inf')
+            for _ in range(5):
+                tree = copy.deepcopy(node)
+                start = time.perf_counter()
+                serializer = builder.TgSerializer()
+                serializer.visit(tree)
+                best = min(best, time.perf_counter() - start)
+            lines = len(serializer._script.flow)
+            print(f'{kind:>8} {depth:>6} {lines:>6} {best * 1000:>9.1f} ms {best / lines * 1e6:>9.1f} us')
+
+
+if __name__ == '__main__':
+    main()
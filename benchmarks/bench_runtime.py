@@ -0,0 +1,48 @@
+'''
+Simulated sessions per second of the runtime.
+
+Every session starts at the start node and picks random options until the script ends.
+The nodes are compiled by the first sessions, the best of five rounds is shown. Run from the repo root:
+
+    python -m benchmarks.bench_runtime
+'''
+import random
+import time
+
+from yab_parser.runtime import Runtime
+from benchmarks.bench_binary_script import make_script
+
+
+def run_sessions(runtime: Runtime, sessions: int, rng: random.Random) -> int:
+    steps = 0
+    for _ in range(sessions):
+        session = runtime.start()
+        while True:
+            run_steps = session.run()
+            steps += len(run_steps)
+            if not session.is_waiting:
+                break
+            session.choose(rng.randrange(len(run_steps[-1].options)))
+    return steps
+
+
+def main():
+    script = make_script(200, 'compact')
+    runtime = Runtime(script)
+    rng = random.Random(0)
+    sessions = 2000
+    run_sessions(runtime, sessions, rng)
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        steps = run_sessions(runtime, sessions, rng)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, steps)
+    elapsed, steps = best
+    print(f'{sessions} sessions, {steps / sessions:.1f} steps per session')
+    print(f'{sessions / elapsed:,.0f} sessions/s, {steps / elapsed:,.0f} steps/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+'''
+Per-line throughput of TgTransformer and BranchSerializer.
+
+Every line of a node goes through the tag, command and message dispatch of
+builder.py. The models are constructed without validation unless the build is
+strict, both are shown. The best of five runs is shown. The nodes of the default
+mode, bare conditions included, are checked to load back from their JSON the same.
+Run from the repo root:
+
+    python -m benchmarks.bench_serializer
+'''
+import copy
+import time
+
+from yab_parser import builder, grammar, schemas
+from benchmarks.story import make_story
+
+
+COMMANDS = [
+    '<<wait 1>>', '<<typing 1>>', '<<upload_photo 1>>', '<<record_voice 2>>',
+    '<<record_video_note 1>>', '<<reaction happy>>', '<<set $gold = $gold + 1>>',
+]
+
+
+def make_lines_story(nodes: int, lines: int) -> str:
+    rows = []
+    for index in range(nodes):
+        rows += [f'title: Lines{index}', '---']
+        for line in range(lines):
+            rows.append(
+                f'Bob: [b]Line[/b] {line} [i]with[/i] [spoiler]tags[/spoiler] [link=https://a.b]x[/link] [u]u'
+            )
+            rows.append(COMMANDS[line % len(COMMANDS)])
+        # A bare value or calculation is a condition of its own
+        rows += [
+            'Ask', '-> Yes <<if $flag>>', '    Yes', '-> More <<if $gold + 1>>', '    More',
+            '<<if $flag>>', '    Flag', '<<elseif 0>>', '    Zero', '<<endif>>',
+        ]
+        rows.append('===')
+    return '\n'.join(rows) + '\n'
+
+
+def count_lines(node) -> int:
+    return sum(1 for _ in node.find_data('line'))
+
+
+def check_node(tree):
+    # The models are not validated in the default mode, a value the schema reads otherwise fails here
+    serializer = builder.TgSerializer()
+    serializer.visit(tree)
+    node_json = serializer._script.model_dump_json()
+    assert schemas.script.Node.model_validate_json(node_json).model_dump_json() == node_json
+    for line in serializer._script.flow.values():
+        if isinstance(line, schemas.script.FlowControl):
+            assert isinstance(line.if_block.condition, schemas.script.Condition)
+
+
+def main():
+    parser = grammar.get_yarn_parser()
+    stories = {
+        'generated story': make_story(100, lines=10),
+        'tags and commands': make_lines_story(100, lines=20),
+    }
+    print(f'{"story":>18} {"lines":>6} {"transform":>16} {"serialize":>16} {"strict":>16}')
+    for name, story in stories.items():
+        visitor = builder.NodesVisitor()
+        visitor.visit(parser.parse(story))
+        nodes = list(visitor.all_nodes.values())
+        lines = sum(count_lines(node) for node in nodes)
+
+        transform_time = serialize_time = strict_time = float('inf')
+        for _ in range(5):
+            trees = [copy.deepcopy(node) for node in nodes]
+            start = time.perf_counter()
+            trees = [builder.TgTransformer().transform(tree) for tree in trees]
+            transform_time = min(transform_time, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for tree in trees:
+                builder.TgSerializer().visit(tree)
+            serialize_time = min(serialize_time, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for tree in trees:
+                builder.TgSerializer(strict=True).visit(tree)
+            strict_time = min(strict_time, time.perf_counter() - start)
+        for tree in trees:
+            check_node(tree)
+        print(' '.join([
+            f'{name:>18} {lines:>6}',
+            f'{lines / transform_time:>10.0f} line/s',
+            f'{lines / serialize_time:>10.0f} line/s',
+            f'{lines / strict_time:>10.0f} line/s',
+        ]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+'''
+Per-node cost of TgTransformer without a formatted-text parser of its own.
+
+Every TgTransformer used to build a formatted-text parser it never used,
+so the per-node cost contained a full grammar load. Run from the repo root:
+
+    python -m benchmarks.bench_text_parser
+'''
+import time
+
+from yab_parser import builder, grammar
+from benchmarks.story import make_story
+
+
+def transform_nodes(nodes: dict, rebuild_parser: bool) -> float:
+    start = time.perf_counter()
+    for node in nodes.values():
+        if rebuild_parser:
+            grammar.build_text_parser(use_cache=False)
+        builder.TgTransformer().transform(node)
+    return time.perf_counter() - start
+
+
+def main():
+    start = time.perf_counter()
+    grammar.build_text_parser(use_cache=False)
+    load_time = time.perf_counter() - start
+    print(f'grammar load: {load_time * 1000:.1f} ms')
+
+    parser = grammar.get_yarn_parser()
+    print(f'{"nodes":>6} {"per node, rebuilt parser":>26} {"per node, no parser":>20}')
+    for nodes_count in (10, 50, 200):
+        visitor = builder.NodesVisitor()
+        visitor.visit(parser.parse(make_story(nodes_count)))
+        rebuilt = transform_nodes(visitor.all_nodes, rebuild_parser=True) if nodes_count <= 50 else None
+        shared = transform_nodes(visitor.all_nodes, rebuild_parser=False)
+        rebuilt_row = f'{rebuilt / nodes_count * 1000:.2f} ms' if rebuilt is not None else 'skipped'
+        print(f'{nodes_count:>6} {rebuilt_row:>26} {shared / nodes_count * 1000:>17.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+Tag balancing of formatted text: normalize_tg_text against BeautifulSoup.
+
+Builds a random corpus of text and tag tokens, empty texts included, checks that
+both give the same markup for every sample and times them. Run from the repo root:
+
+    python -m benchmarks.bench_tg_text
+'''
+import random
+import time
+
+from bs4 import BeautifulSoup
+
+from yab_parser.tg_text import TgTag, normalize_tg_text
+
+
+TAG_NAMES = ['b', 'u', 's', 'i', 'tg-spoiler', 'code']
+# The empty text is what the builder makes of the [/] tag.
+TEXTS = ['Hello', ' world ', 'x', '\n', ':', '$', '{$gold}', '{{', '}}', '&lt;', '&gt;', '"', "'", 'a;b', '#', '']
+# Character references, including the broken ones html.parser gives up on.
+REFERENCES = [
+    '&', '&amp;', '&amp', '&copy', '&copy;', '&foo;', '&foo', '&#65;', '&#x41;', '&#150;', '&#0;',
+    '&#99999999;', '&#', '&#x', '&#;', '& ', '&a', '&-',
+]
+
+
+def make_tag(rng: random.Random) -> TgTag:
+    if rng.random() < 0.15:
+        if rng.random() < 0.5:
+            return TgTag('a', '</a>', is_closing=True)
+        return TgTag('a', rng.choice(['<a href="#">', '<a href="https://a.b/c">', '<a href="{$link}">']))
+    name = rng.choice(TAG_NAMES)
+    if rng.random() < 0.5:
+        return TgTag(name, f'</{name}>', is_closing=True)
+    return TgTag(name, f'<{name}>')
+
+
+def make_corpus(samples: int, texts: list[str], seed: int = 0) -> list[list[str | TgTag]]:
+    rng = random.Random(seed)
+    # [b][/][/b]y and an empty text alone
+    corpus: list[list[str | TgTag]] = [
+        [TgTag('b', '<b>'), '', TgTag('b', '</b>', is_closing=True), 'y'],
+        [''],
+    ]
+    for _ in range(samples):
+        tokens = []
+        for _ in range(rng.randint(0, 12)):
+            tokens.append(make_tag(rng) if rng.random() < 0.4 else rng.choice(texts))
+        corpus.append(tokens)
+    return corpus
+
+
+def normalize_with_bs4(tokens: list[str | TgTag]) -> str:
+    markup = ''.join(token.markup if isinstance(token, TgTag) else token for token in tokens)
+    return str(BeautifulSoup(markup, 'html.parser'))
+
+
+def time_it(func, corpus: list) -> float:
+    start = time.perf_counter()
+    for tokens in corpus:
+        func(tokens)
+    return time.perf_counter() - start
+
+
+def main():
+    corpus = make_corpus(20000, TEXTS + REFERENCES)
+    mismatches = 0
+    for tokens in corpus:
+        expected = normalize_with_bs4(tokens)
+        result = normalize_tg_text(tokens)
+        if result != expected:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f'mismatch: {tokens!r}\n  bs4: {expected!r}\n  new: {result!r}')
+    print(f'samples: {len(corpus)}, mismatches: {mismatches}')
+
+    corpus = make_corpus(20000, TEXTS)
+    bs4_time = time_it(normalize_with_bs4, corpus)
+    new_time = time_it(normalize_tg_text, corpus)
+    print(f'bs4:               {bs4_time / len(corpus) * 1e6:.1f} us per text')
+    print(f'normalize_tg_text: {new_time / len(corpus) * 1e6:.1f} us per text')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+'''
+Synthetic stories for the benchmarks.
+'''
+
+
+def make_node(index: int, links: list[int], lines: int = 5, depth: int = 1, is_entry_point: bool = False) -> str:
+    rows = [f'title: Node{index}']
+    if is_entry_point:
+        rows.append('is_entry_point: true')
+    rows.append('---')
+    if is_entry_point:
+        rows.append('<<declare $gold = 10>>')
+    for line in range(lines):
+        rows.append(f'Speaker{line % 3}: Line {line} of node {index} has [b]bold[/b] and {{$gold}} coins')
+        rows.append('<<typing 1>>')
+    rows += _make_options(index, depth, '')
+    rows.append('<<if $gold > 3 and $gold < 100>>')
+    rows.append('    Rich [i]text[/i]')
+    rows.append('<<else>>')
+    rows.append('    Poor text')
+    rows.append('<<endif>>')
+    for link in links:
+        rows.append(f'<<if $gold == {link}>>')
+        rows.append(f'    <<jump Node{link}>>')
+        rows.append('<<endif>>')
+    rows.append('===')
+    return '\n'.join(rows) + '\n'
+
+
+def _make_options(index: int, depth: int, indent: str) -> list[str]:
+    if not depth:
+        return [f'{indent}Leaf of node {index}']
+    rows = [f'{indent}Question {depth} of node {index}']
+    for option in range(2):
+        rows.append(f'{indent}-> Answer {option} at depth {depth}')
+        rows.append(f'{indent}    <<set $gold = $gold + {option}>>')
+        rows += _make_options(index, depth - 1, indent + '    ')
+    return rows
+
+
+def make_story(nodes: int, branching: int = 2, lines: int = 5, depth: int = 1) -> str:
+    '''
+    Return a story where every node jumps to the next `branching` nodes.
+    '''
+    return ''.join(
+        make_node(
+            index,
+            [link for link in range(index + 1, index + 1 + branching) if link < nodes],
+            lines=lines,
+            depth=depth,
+            is_entry_point=index == 0,
+        )
+        for index in range(nodes)
+    )
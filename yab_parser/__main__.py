@@ -1,8 +1,142 @@
-from yab_parser import build
+import argparse
+import os
+
+from yab_parser import build, config
+from yab_parser.line_ids import LINE_ID_MODES
+from yab_parser.main import print_paths
+from yab_parser.watch import watch
+
+
+def get_build_parser(with_defaults: bool = True) -> argparse.ArgumentParser:
+    '''
+    Return a parent parser with the options of a build, shared by the build and the watch command.
+    Without defaults the options left out of the command do not replace the ones given before it.
+    '''
+    def default(value):
+        return value if with_defaults else argparse.SUPPRESS
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        '--no-grammar-cache',
+        action='store_true',
+        default=default(False),
+        help=f'Do not store compiled grammars in {config.GRAMMAR_CACHE_DIR}.',
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        default=default(False),
+        help=f'Rebuild every story file instead of reusing the build cache in {config.BUILD_CACHE_DIR}.',
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=default(1),
+        help='Parse the story files in N processes, 0 uses every CPU.',
+    )
+    parser.add_argument(
+        '--line-ids',
+        choices=LINE_ID_MODES,
+        default=default('uuid'),
+        help='How to make line ids: random uuids, stable hashes or compact per-node counters.',
+    )
+    parser.add_argument(
+        '--media-dry-run',
+        action='store_true',
+        default=default(False),
+        help=(
+            f'Report the placeholders to create and the unused files to remove in {config.MEDIA_PATH}'
+            ' without changing it.'
+        ),
+    )
+    parser.add_argument(
+        '--binary-script',
+        action='store_true',
+        default=default(False),
+        help='Pack a binary encoding of the script, which loads faster, next to script.json.',
+    )
+    parser.add_argument(
+        '--linked-script',
+        action='store_true',
+        default=default(False),
+        help='Pack the script with the lines of every node in a list and the links resolved to positions.',
+    )
+    parser.add_argument(
+        '--strict',
+        action='store_true',
+        default=default(False),
+        help='Validate every line of the script with the schemas while building, which is slower.',
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        default=default(False),
+        help=f'Write the time and memory of every build stage, story file and node to {config.PROFILE_PATH}.',
+    )
+    parser.add_argument(
+        '--profile-stats',
+        action='store_true',
+        default=default(False),
+        help=f'Write the cProfile stats of the build to {config.PROFILE_STATS_PATH}, for pstats or snakeviz.',
+    )
+    return parser
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='yab_parser',
+        description='Build a yab project.',
+        parents=[get_build_parser()],
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    paths_parser = subparsers.add_parser('paths', help='Print the paths through the last built script.')
+    paths_parser.add_argument('--limit', type=int, default=None, help='Print at most N paths.')
+    watch_parser = subparsers.add_parser(
+        'watch',
+        help='Rebuild the project on every change.',
+        parents=[get_build_parser(with_defaults=False)],
+    )
+    watch_parser.add_argument(
+        '--interval',
+        type=float,
+        default=0.5,
+        help='Check for changes every N seconds when watchdog is not installed.',
+    )
+    return parser.parse_args()
 
 
 def main():
-    build()
+    args = get_args()
+    if args.no_grammar_cache:
+        config.USE_GRAMMAR_CACHE = False
+    if args.command == 'paths':
+        print_paths(args.limit)
+        return
+    if args.command == 'watch':
+        watch(
+            use_cache=not args.no_cache,
+            jobs=args.jobs or os.cpu_count(),
+            line_ids=args.line_ids,
+            interval=args.interval,
+            media_dry_run=args.media_dry_run,
+            binary_script=args.binary_script,
+            linked_script=args.linked_script,
+            strict=args.strict,
+            profile=args.profile,
+            profile_stats=args.profile_stats,
+        )
+        return
+    build(
+        use_cache=not args.no_cache,
+        jobs=args.jobs or os.cpu_count(),
+        line_ids=args.line_ids,
+        media_dry_run=args.media_dry_run,
+        binary_script=args.binary_script,
+        linked_script=args.linked_script,
+        strict=args.strict,
+        profile=args.profile,
+        profile_stats=args.profile_stats,
+    )
 
 
 if __name__ == '__main__':
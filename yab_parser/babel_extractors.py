@@ -1,51 +1,214 @@
-def extract_yab_json(fileobj, keywords, comment_tags, options):
-    import json
+import codecs
+import json
+import os
+from typing import IO, Any, Iterable, Iterator
 
-    content = json.load(fileobj)
-    messages = []
+from yab_parser.schemas.script import Message
 
-    settings = content.get('settings', {})
-    reactions = settings.get('reactions', {})
-    tech_messages = settings.get('tech_messages', {})
-    nodes = content.get('nodes', {})
+# Scripts bigger than this are read node by node instead of with json.load
+STREAM_THRESHOLD = 100 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+JSON_WHITESPACE = ' \t\n\r'
+
+ScriptMessage = tuple[str, list[str]]
 
-    for key, value in reactions.items():
-        if not value:
-            continue
-        messages += [(0, '', item, ['reaction', key]) for item in value]
 
-    for key, value in tech_messages.items():
-        if not value:
+def iter_settings_messages(settings: dict) -> Iterator[ScriptMessage]:
+    for key, value in (settings.get('reactions') or {}).items():
+        for item in value or []:
+            if item:
+                yield item, ['reaction', key]
+
+    for key, value in (settings.get('tech_messages') or {}).items():
+        if value:
+            yield value, ['tech_message', key]
+
+
+def iter_node_messages(node_name: str, node: dict) -> Iterator[ScriptMessage]:
+    '''
+    Yield the messages of a node of script.json: the checkpoint name, then
+    the speaker, the option texts and the text of every message of the flow.
+    '''
+    checkpoint_name = node.get('checkpoint_name')
+    if checkpoint_name:
+        yield checkpoint_name, ['checkpoint_name', node_name]
+    location = f'node: {node_name}'
+    for line in (node.get('flow') or {}).values():
+        if 'message_type' not in line:
             continue
-        messages.append((0, '', value, ['tech_message', key]))
-
-    def recursive_extract(data, node_name: str, is_option=False):
-        if isinstance(data, dict):
-            for key, value in data.items():
-                if key == 'text':
-                    if not value:
-                        continue
-                    messages.append((0, '', value, [
-                        f'node: {node_name}',
-                        'option' if is_option else 'msg',
-                    ]))
-                elif key == 'speaker':
-                    if not value:
-                        continue
-                    messages.append((0, '', value, [
-                        f'node: {node_name}',
-                        'speaker_name',
-                    ]))
-                recursive_extract(value, node_name)
-        elif isinstance(data, list):
-            for item in data:
-                recursive_extract(item, node_name, is_option=True)
-
-    for node_name, node in nodes.items():
-        checkpoint_name = node.get('checkpoint_name')
-        if checkpoint_name:
-            messages.append((0, '', checkpoint_name, ['checkpoint_name', node_name]))
-        flow = node.get('flow', {})
-        recursive_extract(flow, node_name)
-
-    return messages
+        if line.get('speaker'):
+            yield line['speaker'], [location, 'speaker_name']
+        for option in line.get('options') or []:
+            if option.get('text'):
+                yield option['text'], [location, 'option']
+        if line.get('text'):
+            yield line['text'], [location, 'msg']
+
+
+def iter_script_messages(script) -> Iterator[ScriptMessage]:
+    '''
+    Yield the translatable messages of a Script object with their comments,
+    in the same order as extract_yab_json finds them in script.json.
+    '''
+    for key, value in script.settings.reactions.items():
+        for item in value:
+            if item:
+                yield item, ['reaction', key]
+
+    for key, value in script.settings.tech_messages:
+        if value:
+            yield value, ['tech_message', key]
+
+    for node_name, node in script.nodes.items():
+        if node.checkpoint_name:
+            yield node.checkpoint_name, ['checkpoint_name', node_name]
+        for line in node.flow.values():
+            if not isinstance(line, Message):
+                continue
+            if line.speaker:
+                yield line.speaker, [f'node: {node_name}', 'speaker_name']
+            for option in line.options:
+                if option.text:
+                    yield option.text, [f'node: {node_name}', 'option']
+            if line.text:
+                yield line.text, [f'node: {node_name}', 'msg']
+
+
+def merge_messages(messages: Iterable[ScriptMessage]) -> list[ScriptMessage]:
+    '''
+    Return every message once, in the order of its first occurrence,
+    with the comments of all its occurrences.
+    '''
+    merged: dict[str, dict[str, None]] = {}
+    for message, comments in messages:
+        if message in merged:
+            merged[message].update(dict.fromkeys(comments))
+        else:
+            merged[message] = dict.fromkeys(comments)
+    return [(message, list(comments)) for message, comments in merged.items()]
+
+
+class JsonStream():
+    '''
+    Read the values of a JSON document one at a time, so that only the value
+    being decoded is held in memory and not the whole document.
+    '''
+    def __init__(self, fileobj: IO, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+
+    def _fill(self, size: int) -> bool:
+        if self.eof:
+            return False
+        chunk = ''
+        while not chunk:
+            data = self.fileobj.read(size)
+            # The decoder holds back the bytes of a character split between two reads
+            chunk = self._text_decoder.decode(data, final=not data) if isinstance(data, bytes) else data
+            if not data:
+                break
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what is already decoded before growing the buffer
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def next_char(self) -> str:
+        '''
+        Skip the whitespace and return the next character without consuming it, '' at the end.
+        '''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill(self.chunk_size):
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+        if self.next_char() != char:
+            raise ValueError(f'Expected {char!r} at character {self.pos} of the read chunk.')
+        self.pos += 1
+
+    def read_value(self) -> Any:
+        self.next_char()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                value, end = None, None
+            # A number at the end of the buffer may continue in the next chunk
+            if end is not None and (end < len(self.buffer) or self.eof):
+                self.pos = end
+                return value
+            # Read at least as much as is buffered so a big value is decoded a linear number of times
+            if not self._fill(max(self.chunk_size, len(self.buffer))):
+                if end is not None:
+                    self.pos = end
+                    return value
+                raise ValueError('The JSON document ended in the middle of a value.')
+
+    def iter_keys(self) -> Iterator[str]:
+        '''
+        Yield the keys of the object at the current position, the caller reads every value.
+        '''
+        self.expect('{')
+        if self.next_char() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            if self.next_char() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+
+def iter_json_messages(fileobj: IO) -> Iterator[ScriptMessage]:
+    content = json.load(fileobj)
+    yield from iter_settings_messages(content.get('settings') or {})
+    for node_name, node in (content.get('nodes') or {}).items():
+        yield from iter_node_messages(node_name, node)
+
+
+def iter_streamed_json_messages(fileobj: IO, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[ScriptMessage]:
+    stream = JsonStream(fileobj, chunk_size)
+    for key in stream.iter_keys():
+        if key == 'settings':
+            yield from iter_settings_messages(stream.read_value() or {})
+        elif key == 'nodes' and stream.next_char() == '{':
+            for node_name in stream.iter_keys():
+                yield from iter_node_messages(node_name, stream.read_value())
+        else:
+            stream.read_value()
+
+
+def _is_stream(fileobj: IO, options: dict) -> bool:
+    stream = str(options.get('stream', 'auto')).lower()
+    if stream != 'auto':
+        return stream in ('1', 'true', 'yes')
+    try:
+        return os.fstat(fileobj.fileno()).st_size > STREAM_THRESHOLD
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+def extract_yab_json(fileobj, keywords, comment_tags, options):
+    '''
+    Babel extractor of script.json. Every message is extracted once with the
+    comments of all the places it is used in. Scripts bigger than 100 MB are
+    read node by node, the `stream` option (true, false or auto) overrides it.
+    '''
+    if _is_stream(fileobj, options or {}):
+        messages = iter_streamed_json_messages(fileobj)
+    else:
+        messages = iter_json_messages(fileobj)
+    return [(0, '', message, comments) for message, comments in merge_messages(messages)]
@@ -0,0 +1,431 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zipfile
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+from enum import Enum
+from typing import Iterator, TypeVar
+
+from pydantic import BaseModel
+
+from yab_parser import config
+from yab_parser.schemas import script as script_schemas
+from yab_parser.schemas import settings as settings_schemas
+from yab_parser.schemas.script import Node, Script
+from yab_parser.schemas.settings import ScriptSettings
+
+BINARY_SCRIPT_NAME = 'script.bin'
+MAGIC = b'YABS'
+FORMAT_VERSION = 2
+# Magic, format version and the length of the JSON header
+HEADER = struct.Struct('<4sHI')
+FLOAT = struct.Struct('<d')
+# The offset tables are arrays of little-endian uint32 aligned to their size
+OFFSET_TYPE = 'I'
+OFFSET_SIZE = 4
+LAZY_CACHE_SIZE = 256
+
+# Every value of the body starts with a varint of its tag in the low four bits
+# and, for most tags, the string index, the length or the number in the others
+NONE, FALSE, TRUE, INT, FLOAT_TAG, STR, LIST, DICT, MODEL, ENUM = range(10)
+TAG_BITS = 4
+TAG_MASK = 0x0f
+
+
+T = TypeVar('T')
+
+
+def _get_types(base: type[T]) -> dict[str, type[T]]:
+    types = {}
+    for module in (script_schemas, settings_schemas):
+        for name, value in vars(module).items():
+            if (
+                isinstance(value, type)
+                and issubclass(value, base)
+                and value is not base
+                and value.__module__ == module.__name__
+            ):
+                types[name] = value
+    return types
+
+
+MODELS = _get_types(BaseModel)
+ENUMS = _get_types(Enum)
+
+
+class _Encoder():
+    def __init__(self):
+        self.strings = {}
+        self.models = {}
+        self.enum_values = {}
+
+    def _index(self, table: dict, key) -> int:
+        index = table.get(key)
+        if index is None:
+            index = table[key] = len(table)
+        return index
+
+    def write(self, out: bytearray, value):
+        if value is None:
+            out.append(NONE)
+        elif value is True:
+            out.append(TRUE)
+        elif value is False:
+            out.append(FALSE)
+        elif isinstance(value, Enum):
+            _write_token(out, ENUM, self._index(self.enum_values, (type(value).__name__, value.value)))
+        elif isinstance(value, str):
+            _write_token(out, STR, self._index(self.strings, value))
+        elif isinstance(value, int):
+            # Zigzag keeps small negative numbers short
+            _write_token(out, INT, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            out.append(FLOAT_TAG)
+            out += FLOAT.pack(value)
+        elif isinstance(value, (list, tuple)):
+            _write_token(out, LIST, len(value))
+            for item in value:
+                self.write(out, item)
+        elif isinstance(value, dict):
+            _write_token(out, DICT, len(value))
+            for key, item in value.items():
+                self.write(out, key)
+                self.write(out, item)
+        elif isinstance(value, BaseModel):
+            model = type(value)
+            _write_token(out, MODEL, self._index(self.models, model.__name__))
+            for name in model.model_fields:
+                self.write(out, getattr(value, name))
+        else:
+            raise TypeError(f'Can not encode {type(value).__name__} into the binary script.')
+
+    def get_header(self) -> dict:
+        return {
+            'string_count': len(self.strings),
+            'models': [[name, list(MODELS[name].model_fields)] for name in self.models],
+            'enum_values': list(self.enum_values),
+        }
+
+
+def _write_token(out: bytearray, tag: int, payload: int):
+    value = payload << TAG_BITS | tag
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _pack_offsets(offsets: list[int]) -> bytes:
+    packed = array(OFFSET_TYPE, offsets)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def dump_script(script: Script) -> bytes:
+    '''
+    Encode the script into the binary format:
+
+    - the magic, the format version and the size of a JSON header with the tables
+      of the models and enum values, the number of strings and the node names;
+    - the offsets of the strings in the string data and of the nodes in the body;
+    - the string data, every string of the script once;
+    - the body: the script without its nodes, then every node. The values refer
+      to strings, models and enum values by index, models are stored as the list
+      of their field values.
+
+    A node can be decoded on its own from its offset.
+    '''
+    encoder = _Encoder()
+    body = bytearray()
+    encoder.write(body, script.model_copy(update={'nodes': {}}))
+    node_offsets = []
+    for node in script.nodes.values():
+        node_offsets.append(len(body))
+        encoder.write(body, node)
+    node_offsets.append(len(body))
+
+    string_data = bytearray()
+    string_offsets = []
+    for string in encoder.strings:
+        string_offsets.append(len(string_data))
+        string_data += string.encode('utf-8')
+    string_offsets.append(len(string_data))
+
+    header = encoder.get_header()
+    header['nodes'] = list(script.nodes)
+    header_data = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    # Trailing spaces align the offset tables
+    header_data += b' ' * (-(HEADER.size + len(header_data)) % OFFSET_SIZE)
+    return b''.join([
+        HEADER.pack(MAGIC, FORMAT_VERSION, len(header_data)),
+        header_data,
+        _pack_offsets(string_offsets),
+        _pack_offsets(node_offsets),
+        string_data,
+        body,
+    ])
+
+
+def _make_model_factory(model: type[BaseModel], field_names: list[str]):
+    '''
+    Return a function that makes the model from the values of the stored fields without validating them.
+    '''
+    # A script built with other fields keeps only the known ones, model_construct fills in the defaults
+    known_fields = [name if name in model.model_fields else None for name in field_names]
+
+    def construct(values: list):
+        return model.model_construct(**{name: value for name, value in zip(known_fields, values) if name})
+    return construct
+
+
+def _make_dict_factory(field_names: list[str]):
+    def to_dict(values: list) -> dict:
+        return dict(zip(field_names, values))
+    return to_dict
+
+
+def _get_enum_value(enum_name: str, value: str):
+    enum = ENUMS.get(enum_name)
+    # The flow unions are told apart by their enums when validated, so they are decoded in both modes
+    return enum(value) if enum else value
+
+
+def _get_offsets(data, start: int, count: int):
+    offsets = memoryview(data)[start:start + count * OFFSET_SIZE]
+    if sys.byteorder == 'little':
+        return offsets.cast(OFFSET_TYPE)
+    unpacked = array(OFFSET_TYPE, offsets)
+    unpacked.byteswap()
+    return unpacked
+
+
+class _LazyStrings():
+    '''
+    The strings of a binary script, decoded when they are read.
+    '''
+    def __init__(self, data, offsets):
+        self.data = memoryview(data)
+        self.offsets = offsets
+
+    def __getitem__(self, index: int) -> str:
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+
+class _BinaryScript():
+    '''
+    The layout of a binary script and a reader of the values of its body.
+    '''
+    def __init__(self, data, trusted: bool, lazy: bool = False):
+        magic, version, header_size = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('The data is not a binary script.')
+        if version != FORMAT_VERSION:
+            raise ValueError(f'The binary script has the format version {version}, {FORMAT_VERSION} is supported.')
+        position = HEADER.size + header_size
+        header = json.loads(bytes(data[HEADER.size:position]))
+        string_count = header['string_count']
+        self.node_names = header['nodes']
+        string_offsets = _get_offsets(data, position, string_count + 1)
+        position += (string_count + 1) * OFFSET_SIZE
+        self.node_offsets = _get_offsets(data, position, len(self.node_names) + 1)
+        position += (len(self.node_names) + 1) * OFFSET_SIZE
+
+        string_data = memoryview(data)[position:position + string_offsets[string_count]]
+        strings: _LazyStrings | list[str]
+        if lazy:
+            strings = _LazyStrings(string_data, string_offsets)
+        else:
+            strings = [
+                str(string_data[string_offsets[index]:string_offsets[index + 1]], 'utf-8')
+                for index in range(string_count)
+            ]
+        self.body_offset = position + string_offsets[string_count]
+        self.trusted = trusted
+        self.read_at = _make_reader(data, strings, header, trusted)
+
+    def read_script(self):
+        return self.read_at(self.body_offset)
+
+    def read_node(self, index: int):
+        return self.read_at(self.body_offset + self.node_offsets[index])
+
+
+def _make_reader(data, strings, header: dict, trusted: bool):
+    '''
+    Return a function that decodes the value at a position of the data.
+    '''
+    enum_values = [_get_enum_value(enum_name, value) for enum_name, value in header['enum_values']]
+    models = []
+    for name, field_names in header['models']:
+        if not trusted:
+            models.append((_make_dict_factory(field_names), len(field_names)))
+        elif name in MODELS:
+            models.append((_make_model_factory(MODELS[name], field_names), len(field_names)))
+        else:
+            raise ValueError(f'The binary script has the unknown model {name}.')
+    unpack_float = FLOAT.unpack_from
+
+    # The position is passed in and the one after the value returned, so decodes do not share state
+    def read(pos: int) -> tuple:
+        token = data[pos]
+        pos += 1
+        if token & 0x80:
+            token &= 0x7f
+            shift = 7
+            while True:
+                byte = data[pos]
+                pos += 1
+                token |= (byte & 0x7f) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+        tag = token & TAG_MASK
+        if tag == STR:
+            return strings[token >> TAG_BITS], pos
+        if tag == MODEL:
+            factory, count = models[token >> TAG_BITS]
+            values, pos = read_values(pos, count)
+            return factory(values), pos
+        if tag == NONE:
+            return None, pos
+        if tag == ENUM:
+            return enum_values[token >> TAG_BITS], pos
+        if tag == DICT:
+            result = {}
+            for _ in range(token >> TAG_BITS):
+                key, pos = read(pos)
+                result[key], pos = read(pos)
+            return result, pos
+        if tag == LIST:
+            return read_values(pos, token >> TAG_BITS)
+        if tag == INT:
+            value = token >> TAG_BITS
+            return value >> 1 if not value & 1 else -(value >> 1) - 1, pos
+        if tag == FLOAT_TAG:
+            value, = unpack_float(data, pos)
+            return value, pos + FLOAT.size
+        if tag == TRUE:
+            return True, pos
+        if tag == FALSE:
+            return False, pos
+        raise ValueError(f'Unknown tag {tag} at byte {pos} of the binary script.')
+
+    def read_values(pos: int, count: int) -> tuple[list, int]:
+        values = []
+        for _ in range(count):
+            value, pos = read(pos)
+            values.append(value)
+        return values, pos
+
+    def read_at(position: int):
+        return read(position)[0]
+    return read_at
+
+
+def load_script(data: bytes, trusted: bool = False) -> Script:
+    '''
+    Decode a script made by dump_script.
+    A trusted script, one that this builder made, is not validated again, which is much faster.
+    '''
+    binary_script = _BinaryScript(data, trusted)
+    script = binary_script.read_script()
+    nodes = {name: binary_script.read_node(index) for index, name in enumerate(binary_script.node_names)}
+    if trusted:
+        script.nodes = nodes
+        return script
+    script['nodes'] = nodes
+    return Script.model_validate(script)
+
+
+class LazyScript(Mapping):
+    '''
+    The nodes of a binary script by name, decoded on first access.
+    The file is mapped into memory and only the last used nodes are kept decoded,
+    so the memory of a worker grows with the nodes it uses and not with the story.
+    The settings and the start node are read when the script is opened.
+    The script is thread-safe: the decodes share no state and the cache of the nodes
+    is locked, two threads asking for a node that is not cached may both decode it.
+    '''
+    def __init__(self, data, trusted: bool = False, cache_size: int = LAZY_CACHE_SIZE):
+        self._data = data
+        self._binary_script = _BinaryScript(data, trusted, lazy=True)
+        self._indexes = {name: index for index, name in enumerate(self._binary_script.node_names)}
+        self._nodes: OrderedDict[str, Node] = OrderedDict()
+        self._nodes_lock = threading.Lock()
+        self.cache_size = cache_size
+        script = self._binary_script.read_script()
+        if trusted:
+            self.settings = script.settings
+            self.start_node = script.start_node
+        else:
+            self.settings = ScriptSettings.model_validate(script['settings'])
+            self.start_node = script['start_node']
+
+    @classmethod
+    def open(
+        cls,
+        path: str | os.PathLike,
+        trusted: bool = False,
+        cache_size: int = LAZY_CACHE_SIZE,
+    ) -> 'LazyScript':
+        '''
+        Map a binary script file, or the stored script.bin of a build, into memory.
+        '''
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path, 'r') as z:
+                info = z.getinfo(BINARY_SCRIPT_NAME)
+            if info.compress_type != zipfile.ZIP_STORED:
+                data.close()
+                with zipfile.ZipFile(path, 'r') as z:
+                    return cls(z.read(BINARY_SCRIPT_NAME), trusted, cache_size)
+            # The data of an entry follows its local header
+            name_size, extra_size = struct.unpack_from('<HH', data, info.header_offset + 26)
+            start = info.header_offset + 30 + name_size + extra_size
+            return cls(memoryview(data)[start:start + info.file_size], trusted, cache_size)
+        return cls(data, trusted, cache_size)
+
+    @property
+    def nodes(self) -> 'LazyScript':
+        return self
+
+    def __getitem__(self, name: str) -> Node:
+        with self._nodes_lock:
+            node = self._nodes.get(name)
+            if node is not None:
+                self._nodes.move_to_end(name)
+                return node
+        node = self._binary_script.read_node(self._indexes[name])
+        if not self._binary_script.trusted:
+            node = Node.model_validate(node)
+        with self._nodes_lock:
+            self._nodes[name] = node
+            if len(self._nodes) > self.cache_size:
+                self._nodes.popitem(last=False)
+        return node
+
+    def __contains__(self, name) -> bool:
+        return name in self._indexes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._indexes)
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+
+def load_build_script(build_path: str = config.BUILD_PATH, trusted: bool = True) -> Script:
+    '''
+    Load the script of a build, from the binary script when the build has one.
+    '''
+    with zipfile.ZipFile(build_path, 'r') as z:
+        if BINARY_SCRIPT_NAME in z.NameToInfo:
+            return load_script(z.read(BINARY_SCRIPT_NAME), trusted)
+        return Script.model_validate_json(z.read('script.json'))
@@ -1,51 +1,114 @@
-from lark import Lark, Transformer, Tree, Token, Visitor, exceptions
-from lark.indenter import Indenter
+from lark import Transformer, Tree, Token, Visitor, exceptions
 from lark.visitors import Interpreter
+from pydantic import BaseModel, TypeAdapter
 
 import re
 import os
+from collections import Counter
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 import yaml
-from mimetypes import guess_type
-from bs4 import BeautifulSoup
-from uuid import uuid4
-
-from yab_parser import config, schemas
+from typing import Callable, Iterable, Iterator, TypeVar
+
+from yab_parser import config, grammar, profiling, schemas
+from yab_parser.cache import BuildCache, get_digest
+from yab_parser.files import open_atomic
+from yab_parser.graph import Graph, find_path, get_components, get_reachable
+from yab_parser.line_ids import LineIds, make_ident
+from yab_parser.media import sync_media
+from yab_parser.program import compile_program
+from yab_parser.tg_text import TgTag, normalize_tg_text
+
+# Literals of conditions come from the grammar as strings and are converted like Condition.value does
+CONDITION_LITERAL = TypeAdapter(int | float | bool)
+
+
+def _get_condition_values(values: list) -> list:
+    return [CONDITION_LITERAL.validate_python(value) if isinstance(value, str) else value for value in values]
+
+
+# What the validators of the models change in the values the builder makes
+TRUSTED_VALIDATORS: dict[type[BaseModel], dict[str, Callable]] = {
+    schemas.script.Message: {
+        'text': schemas.script.Message.remove_empty_text,
+        'speaker': schemas.script.Message.remove_empty_text,
+    },
+    schemas.script.Option: {'text': schemas.script.Option.remove_empty_text},
+    schemas.script.VariableCommand: {'value': schemas.script.VariableCommand.make_right_type},
+    schemas.script.Condition: {'value': _get_condition_values},
+}
+
+
+M = TypeVar('M', bound=BaseModel)
+
+
+def make_model(model: type[M], strict: bool, **values) -> M:
+    '''
+    Make a model from the values of the serializers. The values are made by the builder,
+    so they are only validated in the strict mode, otherwise the model is constructed
+    with the changes of its validators applied. The script of a build that is not strict
+    is never validated, a strict build also validates the whole script at the end.
+    '''
+    if strict:
+        return model(**values)
+    for name, validate in TRUSTED_VALIDATORS.get(model, {}).items():
+        if values.get(name) is not None:
+            values[name] = validate(values[name])
+    return model.model_construct(**values)
+
+
+def _make_condition(value, strict: bool):
+    # The grammar lets a condition be a bare value or a calculation, the schema only takes a Condition.
+    # Such a condition is true unless its value is false or zero, like `$flag != false`.
+    if value is None or isinstance(value, schemas.script.Condition):
+        return value
+    return make_model(
+        schemas.script.Condition, strict,
+        cond_type=schemas.script.ConditionType.ne,
+        value=[value, False]
+    )
 
 
 class ExpressionSerializer(Transformer):
-    def __init__(self):
+    def __init__(self, strict: bool = False):
         super().__init__()
+        self.strict = strict
 
     def add(self, children):
-        result = schemas.script.Expression(
+        result = make_model(
+            schemas.script.Expression, self.strict,
             exp_type=schemas.script.ExpressionType.add,
             value=children
         )
         return result
 
     def subtract(self, children):
-        result = schemas.script.Expression(
+        result = make_model(
+            schemas.script.Expression, self.strict,
             exp_type=schemas.script.ExpressionType.subtract,
             value=children
         )
         return result
 
     def multiply(self, children):
-        result = schemas.script.Expression(
+        result = make_model(
+            schemas.script.Expression, self.strict,
             exp_type=schemas.script.ExpressionType.multiply,
             value=children
         )
         return result
 
     def divide(self, children):
-        result = schemas.script.Expression(
+        result = make_model(
+            schemas.script.Expression, self.strict,
             exp_type=schemas.script.ExpressionType.divide,
             value=children
         )
         return result
 
     def modulo(self, children):
-        result = schemas.script.Expression(
+        result = make_model(
+            schemas.script.Expression, self.strict,
             exp_type=schemas.script.ExpressionType.modulo,
             value=children
         )
@@ -57,69 +120,86 @@ class ExpressionSerializer(Transformer):
         return float(children[0].value)
 
     def var_name(self, children):
-        return schemas.script.Var(name=children[0].value)
+        return make_model(schemas.script.Var, self.strict, name=children[0].value)
 
 
 class ConditionSerializer(Transformer):
-    def __init__(self):
+    def __init__(self, strict: bool = False):
         super().__init__()
+        self.strict = strict
 
     def and_op(self, children):
-        return schemas.script.Condition(
+        return make_model(
+            schemas.script.Condition, self.strict,
             cond_type=schemas.script.ConditionType.and_op,
             value=children
         )
 
     def or_op(self, children):
-        return schemas.script.Condition(
+        return make_model(
+            schemas.script.Condition, self.strict,
             cond_type=schemas.script.ConditionType.or_op,
             value=children
         )
 
+    def xor_op(self, children):
+        return make_model(
+            schemas.script.Condition, self.strict,
+            cond_type=schemas.script.ConditionType.xor_op,
+            value=children
+        )
+
     def not_op(self, children):
-        return schemas.script.Condition(
+        return make_model(
+            schemas.script.Condition, self.strict,
             cond_type=schemas.script.ConditionType.not_op,
             value=children
         )
 
     def eq(self, children):
-        return schemas.script.Condition(
+        return make_model(
+            schemas.script.Condition, self.strict,
             cond_type=schemas.script.ConditionType.eq,
             value=children
         )
 
     def ne(self, children):
-        return schemas.script.Condition(
+        return make_model(
+            schemas.script.Condition, self.strict,
             cond_type=schemas.script.ConditionType.ne,
             value=children
         )
 
     def lt(self, children):
-        return schemas.script.Condition(
+        return make_model(
+            schemas.script.Condition, self.strict,
             cond_type=schemas.script.ConditionType.lt,
             value=children
         )
 
     def gt(self, children):
-        return schemas.script.Condition(
+        return make_model(
+            schemas.script.Condition, self.strict,
             cond_type=schemas.script.ConditionType.gt,
             value=children
         )
 
     def le(self, children):
-        return schemas.script.Condition(
+        return make_model(
+            schemas.script.Condition, self.strict,
             cond_type=schemas.script.ConditionType.le,
             value=children
         )
 
     def ge(self, children):
-        return schemas.script.Condition(
+        return make_model(
+            schemas.script.Condition, self.strict,
             cond_type=schemas.script.ConditionType.ge,
             value=children
         )
 
     def calculate(self, children):
-        return ExpressionSerializer().transform(Tree(Token('RULE', 'calculate'), children)).children[0]
+        return ExpressionSerializer(self.strict).transform(Tree(Token('RULE', 'calculate'), children)).children[0]
 
     def value(self, children):
         child = children[0]
@@ -129,95 +209,106 @@ class ConditionSerializer(Transformer):
             return child.children[0].value
 
 
+MESSAGE_TYPES = {
+    'text_message': schemas.script.MessageType.text,
+    'video_message': schemas.script.MessageType.video,
+    'photo_message': schemas.script.MessageType.photo,
+    'voice_message': schemas.script.MessageType.voice,
+    'video_note_message': schemas.script.MessageType.video_note
+}
+# The status sending rules of the grammar are named after their command types.
+STATUS_COMMAND_TYPES = {
+    command_type.value: command_type for command_type in schemas.script.status_message_command_types
+}
+
+
+def _link_exits(exits: list, link: str | None):
+    # The exits of the nested branches are kept as lists in the exits of their parents
+    stack = [exits]
+    while stack:
+        for exit in stack.pop():
+            if isinstance(exit, list):
+                stack.append(exit)
+            else:
+                setattr(exit[0], exit[1], link)
+
+
 class BranchSerializer(Interpreter):
-    def __init__(self):
+    '''
+    Serialize the lines of a branch into the flow of a node. The branches of options and
+    if blocks are serialized into the same flow by serializers of their own.
+    The links to the line after the current one are kept as exits, a pair of a model and
+    its link field, and set once that line is known, so every link is set once.
+    '''
+    def __init__(
+        self,
+        line_ids: LineIds | None = None,
+        flow: dict | None = None,
+        exist_uids: dict | None = None,
+        strict: bool = False,
+    ):
         super().__init__()
-        self._flow = {}
-        self.msg_types = {
-            'text_message': schemas.script.MessageType.text,
-            'video_message': schemas.script.MessageType.video,
-            'photo_message': schemas.script.MessageType.photo,
-            'voice_message': schemas.script.MessageType.voice,
-            'video_note_message': schemas.script.MessageType.video_note
-        }
+        self._line_ids = line_ids or LineIds()
+        self.strict = strict
+        self._flow = {} if flow is None else flow
+        self._exits: list = []
         self.next_uuid = ''
         self.last_uid = ''
-        self.exist_uids = {}
+        self.exist_uids = {} if exist_uids is None else exist_uids
 
     def line(self, tree):
         line_type = tree.children[0].data.value
-        if line_type in [
-            'jump_command',
-            'wait_command',
-            'reaction_command',
-            'var_command',
-            'status_sending_command',
-            'back_to_flow_command'
-        ]:
+        if line_type in self._command_getters:
             self._set_uidds()
-            self._flow[self.last_uid] = self._get_command(tree.children[0])
-            self._flow[self.last_uid].next_line_id = self.next_uuid
-        elif line_type in ['text_message', 'video_message', 'photo_message', 'voice_message', 'video_note_message']:
+            line = self._get_command(tree.children[0])
+        elif line_type in MESSAGE_TYPES:
             self._set_uidds(tree.children[0].children)
-            self._flow[self.last_uid], addition_flow = self._get_message(tree.children, line_type)
-            self._flow.update(addition_flow)
-            self._flow[self.last_uid].next_line_id = self.next_uuid
+            # Taken before the lines of the options to keep the order of the flow
+            self._flow[self.last_uid] = None
+            line = self._get_message(tree.children, line_type)
         elif line_type == 'condition_block':
             self._set_uidds()
-            self._flow[self.last_uid], addition_flow = self._get_condition_block(tree.children[0])
-            self._flow.update(addition_flow)
-            self._flow[self.last_uid].next_line_id = self.next_uuid
-
-    def _set_out_link(self, link):
-        links = self._flow.keys()
-        for key in self._flow:
-            if isinstance(self._flow[key], schemas.script.Message) and self._flow[key].options:
-                for option in self._flow[key].options:
-                    if option.link in links:
-                        continue
-                    option.link = link
-            elif isinstance(self._flow[key], schemas.script.FlowControl):
-                if self._flow[key].if_block.link in links:
-                    continue
-                self._flow[key].if_block.link = link
-
-                for elif_block in self._flow[key].elif_blocks:
-                    if elif_block.link in links:
-                        continue
-                    elif_block.link = link
-
-                if self._flow[key].else_block:
-                    if self._flow[key].else_block.link in links:
-                        continue
-                    self._flow[key].else_block.link = link
+            self._flow[self.last_uid] = None
+            line = self._get_condition_block(tree.children[0])
+        else:
+            return
+        line.next_line_id = self.next_uuid
+        self._flow[self.last_uid] = line
+        self._exits.append((line, 'next_line_id'))
 
-            if self._flow[key].next_line_id in links:
-                continue
-            self._flow[key].next_line_id = link
+    def _serialize_branch(self, tree, start_link: str):
+        branch_serializer = BranchSerializer(self._line_ids, self._flow, self.exist_uids, self.strict)
+        branch_serializer.next_uuid = start_link
+        branch_serializer.visit(tree)
+        # The branch goes on with the line after the current one
+        self._exits.append(branch_serializer._exits)
 
     def _postprocess(self):
-        flow = self._flow.copy()
-        self._flow = {}
-        for key in flow:
-            true_key = self.exist_uids.get(key, key)
-            flow[key].next_line_id = self.exist_uids.get(flow[key].next_line_id, flow[key].next_line_id)
-            if isinstance(flow[key], schemas.script.Message):
-                for option in flow[key].options:
-                    option.link = self.exist_uids.get(option.link, option.link)
-            elif isinstance(flow[key], schemas.script.FlowControl):
-                if flow[key].if_block:
-                    flow[key].if_block.link = self.exist_uids.get(flow[key].if_block.link, flow[key].if_block.link)
-                for elif_block in flow[key].elif_blocks:
-                    elif_block.link = self.exist_uids.get(elif_block.link, elif_block.link)
-                if flow[key].else_block:
-                    flow[key].else_block.link = self.exist_uids.get(
-                        flow[key].else_block.link, flow[key].else_block.link
-                    )
-            self._flow[true_key] = flow[key]
-
-        for key in self._flow:
-            if not self._flow.get(self._flow[key].next_line_id):
-                self._flow[key].next_line_id = None
+        '''
+        End the flow of the node: the exits left lead out of the node and the lines
+        with a line ident get it as their id.
+        '''
+        _link_exits(self._exits, self.next_uuid)
+        self._exits = []
+        exist_uids = self.exist_uids
+        flow = {}
+        for key, line in self._flow.items():
+            links = [(line, 'next_line_id')]
+            if isinstance(line, schemas.script.Message):
+                links += [(option, 'link') for option in line.options]
+            elif isinstance(line, schemas.script.FlowControl):
+                blocks = [line.if_block, *line.elif_blocks, line.else_block]
+                links += [(block, 'link') for block in blocks if block]
+            for model, name in links:
+                link = getattr(model, name)
+                if link in exist_uids:
+                    setattr(model, name, exist_uids[link])
+            flow[exist_uids.get(key, key)] = line
+        self._flow = flow
+
+        for line in flow.values():
+            if line.next_line_id is not None and line.next_line_id not in flow:
+                line.next_line_id = None
 
     def _set_uidds(self, children: list = []):
         for child in children:
@@ -227,42 +318,49 @@ class BranchSerializer(Interpreter):
                 self.exist_uids[self.next_uuid] = child.children[0].value
                 break
         self.last_uid = self.next_uuid
-        self.next_uuid = str(uuid4())
+        self.next_uuid = self._line_ids()
+        # The exits of the previous line lead to this one
+        _link_exits(self._exits, self.last_uid)
+        self._exits = []
 
     def _get_command(self, child):
-        command = None
-        if child.data.value == 'jump_command':
-            node_name = list(child.find_data('node_name'))
-            node_name = node_name[0].children[0].value
-            command = schemas.script.Command(
-                command_type=schemas.script.CommandType.jump,
-                args={'node_name': node_name}
-            )
-        elif child.data.value == 'wait_command':
-            seconds = list(child.find_data('seconds'))
-            seconds = float(seconds[0].children[0].value)
-            command = schemas.script.Command(
-                command_type=schemas.script.CommandType.wait,
-                args={'seconds': seconds}
-            )
-        elif child.data.value == 'reaction_command':
-            reaction = list(child.find_data('reaction'))
-            reaction = reaction[0].children[0].value
-            command = schemas.script.Command(
-                command_type=schemas.script.CommandType.reaction,
-                args={'reaction': reaction}
-            )
-        elif child.data.value == 'var_command':
-            command = self._get_var_command(child.children[0])
-        elif child.data.value == 'status_sending_command':
-            command = self._get_status_sending_command(child)
-        elif child.data.value == 'back_to_flow_command':
-            command = schemas.script.Command(
-                command_type=schemas.script.CommandType.back_to_flow,
-            )
-        return command
+        return self._command_getters[child.data.value](self, child)
+
+    def _get_jump_command(self, child):
+        node_name = list(child.find_data('node_name'))
+        node_name = node_name[0].children[0].value
+        return make_model(
+            schemas.script.Command, self.strict,
+            command_type=schemas.script.CommandType.jump,
+            args={'node_name': node_name}
+        )
+
+    def _get_wait_command(self, child):
+        seconds = list(child.find_data('seconds'))
+        seconds = float(seconds[0].children[0].value)
+        return make_model(
+            schemas.script.Command, self.strict,
+            command_type=schemas.script.CommandType.wait,
+            args={'seconds': seconds}
+        )
+
+    def _get_reaction_command(self, child):
+        reaction = list(child.find_data('reaction'))
+        reaction = reaction[0].children[0].value
+        return make_model(
+            schemas.script.Command, self.strict,
+            command_type=schemas.script.CommandType.reaction,
+            args={'reaction': reaction}
+        )
+
+    def _get_back_to_flow_command(self, child):
+        return make_model(
+            schemas.script.Command, self.strict,
+            command_type=schemas.script.CommandType.back_to_flow,
+        )
 
     def _get_var_command(self, child):
+        child = child.children[0]
         var_name = list(child.find_data('var_name'))
         var_name = var_name[0].children[0].value
 
@@ -270,23 +368,29 @@ class BranchSerializer(Interpreter):
         value = value[0].children[0].children[0].value if value else None
         calculation = list(child.find_data('calculate'))
         if calculation:
-            calculation = ExpressionSerializer().transform(calculation[0]).children[0]
+            calculation = ExpressionSerializer(self.strict).transform(calculation[0]).children[0]
         else:
             calculation = None
 
+        program = compile_program(calculation) if calculation else None
+
         if child.data.value == 'set_var':
-            var_command = schemas.script.VariableCommand(
+            var_command = make_model(
+                schemas.script.VariableCommand, self.strict,
                 command_type=schemas.script.VariableCommandType.set,
                 name=var_name,
                 value=value,
                 calculation=calculation,
+                program=program,
             )
         elif child.data.value == 'declare_var':
-            var_command = schemas.script.VariableCommand(
+            var_command = make_model(
+                schemas.script.VariableCommand, self.strict,
                 command_type=schemas.script.VariableCommandType.declare,
                 name=var_name,
                 value=value,
                 calculation=calculation,
+                program=program,
             )
         return var_command
 
@@ -294,45 +398,29 @@ class BranchSerializer(Interpreter):
         type_command = child.children[0].data.value
         seconds = list(child.find_data('seconds'))
         seconds = float(seconds[0].children[0].value)
-
-        if type_command == 'typing':
-            return schemas.script.Command(
-                command_type=schemas.script.CommandType.typing,
-                args={'seconds': seconds}
-            )
-        elif type_command == 'upload_photo':
-            return schemas.script.Command(
-                command_type=schemas.script.CommandType.upload_photo,
-                args={'seconds': seconds}
-            )
-        elif type_command == 'record_voice':
-            return schemas.script.Command(
-                command_type=schemas.script.CommandType.record_voice,
-                args={'seconds': seconds}
-            )
-        elif type_command == 'record_video_note':
-            return schemas.script.Command(
-                command_type=schemas.script.CommandType.record_video_note,
-                args={'seconds': seconds}
-            )
+        return make_model(
+            schemas.script.Command, self.strict,
+            command_type=STATUS_COMMAND_TYPES[type_command],
+            args={'seconds': seconds}
+        )
 
     def _get_message(self, msg_children, message_type):
         msg = msg_children[0]
         if len(msg_children) == 2:
-            options, flow = self._get_options(msg_children[1])
+            options = self._get_options(msg_children[1])
         else:
             options = []
-            flow = {}
 
         media, text, speaker = self._get_message_data(msg.children)
 
-        return schemas.script.Message(
-            message_type=self.msg_types[message_type],
+        return make_model(
+            schemas.script.Message, self.strict,
+            message_type=MESSAGE_TYPES[message_type],
             speaker=speaker,
             options=options,
             media=media,
             text=text
-        ), flow
+        )
 
     def _get_message_data(self, children):
         media = None
@@ -348,18 +436,11 @@ class BranchSerializer(Interpreter):
         return media, text, speaker
 
     def _get_options(self, options_tree):
-        options = []
-        flow = {}
-        for option in options_tree.children:
-            next_options, add_flow = self._get_option(option)
-            options.append(next_options)
-            flow.update(add_flow)
-        return options, flow
+        return [self._get_option(option) for option in options_tree.children]
 
     def _get_option(self, option_tree):
         text = None
         condition = None
-        flow = {}
         for child in option_tree.children:
             tree_type = child.data.value if isinstance(child.data, Token) else child.data
             start_link = None
@@ -368,57 +449,65 @@ class BranchSerializer(Interpreter):
             elif tree_type == 'if_statement':
                 condition = child.children[0].value
             elif tree_type == 'branch':
-                branch_serializer = BranchSerializer()
-                start_link = str(uuid4())
-                branch_serializer.next_uuid = start_link
-                branch_serializer.visit(child)
-                branch_serializer._postprocess()
-                branch_serializer._set_out_link(self.next_uuid)
-                flow = branch_serializer._flow
-                start_link = branch_serializer.exist_uids.get(start_link, start_link)
+                start_link = self._line_ids()
+                self._serialize_branch(child, start_link)
             elif tree_type == 'conditions':
-                condition = ConditionSerializer().transform(child).children[0]
-        return schemas.script.Option(
+                condition = ConditionSerializer(self.strict).transform(child).children[0]
+                condition = _make_condition(condition, self.strict)
+        option = make_model(
+            schemas.script.Option, self.strict,
             text=text,
             condition=condition,
+            program=compile_program(condition) if condition is not None else None,
             link=start_link if start_link else self.next_uuid
-        ), flow
+        )
+        if not start_link:
+            self._exits.append((option, 'link'))
+        return option
 
     def _get_condition_block(self, condition_tree):
-        condition_block = schemas.script.FlowControl()
-        additional_flow = {}
+        condition_block = make_model(schemas.script.FlowControl, self.strict)
         for child in condition_tree.children:
             if len(child.children) == 2:
-                branch_serializer = BranchSerializer()
-                start_link = str(uuid4())
-                branch_serializer.next_uuid = start_link
-                branch_serializer.visit(child.children[1])
-                branch_serializer._postprocess()
-                branch_serializer._set_out_link(self.next_uuid)
-                additional_flow.update(branch_serializer._flow)
-                start_link = branch_serializer.exist_uids.get(start_link, start_link)
+                start_link = self._line_ids()
+                self._serialize_branch(child.children[1], start_link)
             else:
                 start_link = None
-            flow_control_element = schemas.script.FlowControlElement(
+            condition = None
+            if child.data in ('if_block', 'elif_block'):
+                condition = ConditionSerializer(self.strict).transform(child.children[0]).children[0]
+                condition = _make_condition(condition, self.strict)
+            flow_control_element = make_model(
+                schemas.script.FlowControlElement, self.strict,
+                condition=condition,
+                program=compile_program(condition) if condition is not None else None,
                 link=start_link
             )
-
             if child.data == 'if_block':
-                flow_control_element.condition = ConditionSerializer().transform(child.children[0]).children[0]
                 condition_block.if_block = flow_control_element
             elif child.data == 'elif_block':
-                flow_control_element.condition = ConditionSerializer().transform(child.children[0]).children[0]
                 condition_block.elif_blocks.append(flow_control_element)
             elif child.data == 'else_block':
                 condition_block.else_block = flow_control_element
 
-        return condition_block, additional_flow
+        return condition_block
+
+    _command_getters = {
+        'jump_command': _get_jump_command,
+        'wait_command': _get_wait_command,
+        'reaction_command': _get_reaction_command,
+        'var_command': _get_var_command,
+        'status_sending_command': _get_status_sending_command,
+        'back_to_flow_command': _get_back_to_flow_command,
+    }
 
 
 class TgSerializer(Interpreter):
-    def __init__(self):
+    def __init__(self, line_ids: LineIds | None = None, strict: bool = False):
         super().__init__()
-        self._script = schemas.script.Node()
+        self._line_ids = line_ids
+        self.strict = strict
+        self._script = make_model(schemas.script.Node, self.strict)
 
     def header(self, tree):
         for child in tree.children:
@@ -438,13 +527,35 @@ class TgSerializer(Interpreter):
                 self._script.time_for_status = child.children[0].value.strip()
 
     def branch(self, tree):
-        branch_serializer = BranchSerializer()
+        branch_serializer = BranchSerializer(self._line_ids, strict=self.strict)
         branch_serializer.visit(tree)
         branch_serializer._postprocess()
         self._script.flow = branch_serializer._flow
 
 
 
+TG_TAGS = {
+    'line_break_tag': '\n',
+    'colon_tag': ':',
+    'usd_tag': '$',
+    'close_link_tag': TgTag('a', '</a>', is_closing=True),
+    'open_bold_tag': TgTag('b', '<b>'),
+    'close_bold_tag': TgTag('b', '</b>', is_closing=True),
+    'open_underline_tag': TgTag('u', '<u>'),
+    'close_underline_tag': TgTag('u', '</u>', is_closing=True),
+    'open_strike_tag': TgTag('s', '<s>'),
+    'close_strike_tag': TgTag('s', '</s>', is_closing=True),
+    'open_italic_tag': TgTag('i', '<i>'),
+    'close_italic_tag': TgTag('i', '</i>', is_closing=True),
+    'open_spoiler_tag': TgTag('tg-spoiler', '<tg-spoiler>'),
+    'close_spoiler_tag': TgTag('tg-spoiler', '</tg-spoiler>', is_closing=True),
+    'open_monospace_tag': TgTag('code', '<code>'),
+    'close_monospace_tag': TgTag('code', '</code>', is_closing=True),
+    'close_all_tags': '',
+}
+ESCAPED_CHARS = {'{': '{{', '}': '}}', '<': '&lt;', '>': '&gt;'}
+
+
 class TgTransformer(Transformer):
     def __init__(
         self,
@@ -453,7 +564,6 @@ class TgTransformer(Transformer):
         self._header_params = [
             'title', 'checkpoint_name', 'start_on_command', 'reaction', 'wait', 'time', 'time_for_status'
         ]
-        self.text_parser = self._get_lark_text_parser()
         self._error_rows = []
 
     def line(self, children):
@@ -499,24 +609,9 @@ class TgTransformer(Transformer):
                 tg_text_row.append('{' + var_name[0].children[0].value + '}')
                 continue
             elif child.data.value == 'escaped_char':
-                if child.children[0].value in ['{', '}']:
-                    tg_text_row.append(child.children[0].value*2)
-                    continue
-                elif child.children[0].value == '<':
-                    tg_text_row.append('&lt;')
-                    continue
-                elif child.children[0].value == '>':
-                    tg_text_row.append('&gt;')
-                    continue
-                tg_text_row.append(child.children[0].value)
-        soup = BeautifulSoup(''.join(tg_text_row), 'html.parser')
-        corrected_tg_text = str(soup)
-        return corrected_tg_text
-
-    def _get_lark_text_parser(self) -> Lark:
-        with open(config.LARK_GRAMMAR_PATH, 'r') as f:
-            grammar = f.read()
-        return Lark(grammar, parser='lalr', start='formated_text', debug=True)
+                char = child.children[0].value
+                tg_text_row.append(ESCAPED_CHARS.get(char, char))
+        return normalize_tg_text(tg_text_row)
 
     def _make_error_parser_func(self, ident: str):
         def error_func(error: exceptions.LarkError, ident: str = ident):
@@ -530,9 +625,7 @@ class TgTransformer(Transformer):
 
     def _add_tg_tag(self, tag_tree: Tree):
         tag_type = tag_tree.data.value
-        if tag_type == 'line_break_tag':
-            return '\n'
-        elif tag_type == 'open_link_tag':
+        if tag_type == 'open_link_tag':
             url_tree = list(tag_tree.find_data('url'))
             if url_tree:
                 var_name = list(url_tree[0].find_data('var_name'))
@@ -540,40 +633,17 @@ class TgTransformer(Transformer):
                     url = '{' + var_name[0].children[0].value + '}'
                 else:
                     url = url_tree[0].children[0].value
-                return f'<a href="{url}">'
-            return '<a href="#">'
-        elif tag_type == 'close_link_tag':
-            return '</a>'
-        elif tag_type == 'colon_tag':
-            return ':'
-        elif tag_type == 'usd_tag':
-            return '$'
-        elif tag_type == 'open_bold_tag':
-            return '<b>'
-        elif tag_type == 'close_bold_tag':
-            return '</b>'
-        elif tag_type == 'open_underline_tag':
-            return '<u>'
-        elif tag_type == 'close_underline_tag':
-            return '</u>'
-        elif tag_type == 'open_strike_tag':
-            return '<s>'
-        elif tag_type == 'close_strike_tag':
-            return '</s>'
-        elif tag_type == 'open_italic_tag':
-            return '<i>'
-        elif tag_type == 'close_italic_tag':
-            return '</i>'
-        elif tag_type == 'open_spoiler_tag':
-            return '<tg-spoiler>'
-        elif tag_type == 'close_spoiler_tag':
-            return '</tg-spoiler>'
-        elif tag_type == 'open_monospace_tag':
-            return '<code>'
-        elif tag_type == 'close_monospace_tag':
-            return '</code>'
-        elif tag_type == 'close_all_tags':
-            return ''
+                return TgTag('a', f'<a href="{url}">')
+            return TgTag('a', '<a href="#">')
+        return TG_TAGS[tag_type]
+
+
+def get_source_name(node_tree: Tree) -> str:
+    '''
+    Return the name of the .yarn file the node was parsed from.
+    '''
+    source_path = getattr(node_tree.meta, 'source_path', None)
+    return os.path.basename(source_path) if source_path else 'the script'
 
 
 class HeaderVisitor(Visitor):
@@ -594,7 +664,7 @@ class HeaderVisitor(Visitor):
 class NodesVisitor(Visitor):
     def __init__(self):
         self.all_nodes = {}
-        self.start_node = None
+        self.start_nodes = []
         self.error_rows = []
 
     def node(self, tree: Tree):
@@ -602,14 +672,10 @@ class NodesVisitor(Visitor):
         header_visitor = HeaderVisitor()
         header_visitor.visit(header)
         if not header_visitor.is_title:
-            self.error_rows.append('The node does not have a title.')
+            self.error_rows.append(f'The node in {get_source_name(tree)} does not have a title.')
         self.all_nodes[header_visitor.title] = tree
         if header_visitor.is_start_node:
-            self.start_node = header_visitor.title
-        elif header_visitor.is_start_node and self.start_node:
-            self.error_rows.append(
-                f'There are more than one start nodes - {header_visitor.title} and {self.start_node}'
-            )
+            self.start_nodes.append(header_visitor.title)
 
 
 class FlowVisitor(Visitor):
@@ -647,92 +713,347 @@ class FlowVisitor(Visitor):
         media_name = tree.children[0]
         self.used_media.add(media_name.value)
 
+    def get_facts(self) -> tuple:
+        '''
+        Return everything the cross-node checks read from the node.
+        '''
+        return (
+            sorted(self.declared_vars),
+            sorted(self.used_vars),
+            sorted(self.declared_vars_in_node),
+            sorted(self.used_vars_in_node),
+            sorted(self.node_links),
+            sorted(self.used_media),
+        )
+
+
+class StoryFile():
+    '''
+    The parsed and serialized nodes of one .yarn file.
+    With `strict` every model of the nodes is validated when it is made.
+    The wall and CPU times of its stages are kept in `timings` and the ones of every node in `node_timings`.
+    '''
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        script_rows: list[str],
+        line_ids: str = 'uuid',
+        strict: bool = False,
+    ):
+        self.path = path
+        self.line_ids = line_ids
+        self.strict = strict
+        self.digest = get_digest(''.join(script_rows))
+        self.is_parsed = False
+        self.error_rows: list[str] = []
+        self.start_nodes: list[str] = []
+        self.flows: dict[str, FlowVisitor] = {}
+        self.nodes: dict[str, schemas.script.Node] = {}
+        self.timings: dict[str, profiling.Timing] = {}
+        self.node_timings: dict[str, dict[str, profiling.Timing]] = {}
+        self._compile(script_rows)
+
+    def _compile(self, script_rows: list[str]):
+        file_name = os.path.basename(self.path)
+        start = profiling.get_clock()
+        try:
+            parsed_file = grammar.get_yarn_parser().parse(
+                ''.join(script_rows),
+                on_error=self._make_error_parser_func(file_name)
+            )
+        except exceptions.LarkError:
+            self.error_rows.append(f'The script {self.path} is incorrect.')
+            return
+        finally:
+            self.timings['parse'] = profiling.get_timing(start)
+        if self.error_rows:
+            return
+        self.is_parsed = True
+
+        # A file with a single node is parsed straight into the node tree
+        file_nodes: list = parsed_file.children if parsed_file.data == 'nodes' else [parsed_file]
+        for node in file_nodes:
+            node.meta.source_path = self.path
+        nodes_visitor = NodesVisitor()
+        nodes_visitor.visit(parsed_file)
+        self.start_nodes = nodes_visitor.start_nodes
+        self.error_rows += nodes_visitor.error_rows
+
+        for node_name, node_tree in nodes_visitor.all_nodes.items():
+            node_timings = self.node_timings[node_name] = {}
+            start = profiling.get_clock()
+            flow_visitor = FlowVisitor()
+            flow_visitor.visit(node_tree)
+            self.flows[node_name] = flow_visitor
+            node_timings['facts'] = profiling.get_timing(start)
+
+            start = profiling.get_clock()
+            tg_transformer = TgTransformer()
+            tg_tree = tg_transformer.transform(node_tree)
+            self.error_rows += tg_transformer._error_rows
+            node_timings['transform'] = profiling.get_timing(start)
+
+            start = profiling.get_clock()
+            tg_serializer = TgSerializer(LineIds(self.line_ids, seed=node_name), self.strict)
+            tg_serializer.visit(tg_tree)
+            self.nodes[node_name] = tg_serializer._script
+            node_timings['serialize'] = profiling.get_timing(start)
+
+        for name in profiling.NODE_STAGES:
+            self.timings[name] = profiling.sum_timings(
+                [node_timings[name] for node_timings in self.node_timings.values()]
+            )
+
+    def _make_error_parser_func(self, file_name: str):
+        def error_func(error: exceptions.LarkError, file_name: str = file_name):
+            if isinstance(error, exceptions.UnexpectedToken):
+                self.error_rows.append(
+                    ' '.join([
+                        f'Error in {file_name} line {error.line}',
+                        f'column {error.column}: expected tokens {error.expected}',
+                        f'but got "{error.token}"',
+                    ])
+                )
+                return True
+            return False
+        return error_func
+
+
+LINE_RE = re.compile(r'^[^<\/\n].+')
+IDENT_RE = re.compile(r'(?<!\\)#\s*line\s*:\s*[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+COMMENT_RE = re.compile(r'(?<!\\)//')
+TAGS_RE = re.compile(r'(?<!\\)\[.*?\s*(?<!\\)]')
+
+
+def iter_idented_rows(
+    script_rows: Iterable[str],
+    line_ids: str = 'uuid',
+    source_name: str = '',
+) -> Iterator[tuple[str, bool]]:
+    '''
+    Yield the rows of a story file with a `#line:` ident added to every body line that has none,
+    together with a flag telling if the ident was added.
+    '''
+    is_body = False
+    for row_index, row in enumerate(script_rows):
+        stripped_row = row.strip()
+        if stripped_row == '---':
+            is_body = True
+        elif stripped_row == '===':
+            is_body = False
+        elif is_body and LINE_RE.match(stripped_row) and not IDENT_RE.search(row):
+            _, *comments = COMMENT_RE.split(TAGS_RE.sub('', row))
+            comment = f'//{"//".join(comments)}'.strip() if comments else ''
+            base_line = row.replace('\n', '').strip(comment)
+            ident = make_ident(line_ids, f'{source_name}:{row_index}:{row}')
+            yield f'{base_line} #line:{ident}' + comment + '\n', True
+            continue
+        yield row, False
+
+
+def add_idents(script_rows: Iterable[str], line_ids: str = 'uuid', source_name: str = '') -> tuple[list[str], int]:
+    '''
+    Return the rows with the missing line idents and the number of added idents.
+    '''
+    idented_script_rows = []
+    added_idents = 0
+    for row, is_added in iter_idented_rows(script_rows, line_ids, source_name):
+        idented_script_rows.append(row)
+        added_idents += is_added
+    return idented_script_rows, added_idents
+
+
+def compile_story_file(
+    path: str | os.PathLike,
+    script_rows: list[str],
+    line_ids: str = 'uuid',
+    strict: bool = False,
+) -> tuple[list[str], int, StoryFile]:
+    '''
+    Add the missing line idents and compile one story file.
+    It runs in the worker processes of a parallel build, so it takes and returns only picklable data.
+    '''
+    start = profiling.get_clock()
+    script_rows, added_idents = add_idents(script_rows, line_ids, os.path.basename(path))
+    ident_timing = profiling.get_timing(start)
+    story_file = StoryFile(path, script_rows, line_ids, strict)
+    story_file.timings['ident'] = ident_timing
+    return script_rows, added_idents, story_file
+
+
+def _init_worker(use_grammar_cache: bool):
+    config.USE_GRAMMAR_CACHE = use_grammar_cache
+
 
 class YabScriptChecker():
-    def __init__(self, yab_script: 'YabScriptBuilder'):
-        self.start_node = None
+    def __init__(self, story_files: list[StoryFile]):
+        self.start_node = ''
         self.sep_nodes = {}
         self.error_rows = []
-        self.start_node = None
-        self.paths = []
+        self.graph: Graph = {}
         self.media = set()
-        self._check_nodes(yab_script)
+        self._missing_nodes: set[str] = set()
+        self._declarations: dict[str, set[str]] = {}
+        self._check_nodes(story_files)
         self._check_flow()
 
-    def _check_nodes(self, yab_script: 'YabScriptBuilder'):
-        nodes_visitor = NodesVisitor()
-        nodes_visitor.visit(yab_script.parsed_script)
-        self.sep_nodes = nodes_visitor.all_nodes
-        self.start_node = nodes_visitor.start_node
+    @staticmethod
+    def get_signature(story_files: list[StoryFile]) -> str:
+        '''
+        Return the digest of everything the checks depend on.
+        Edits that keep it the same cannot change the result of the checks.
+        '''
+        facts: list[tuple] = []
+        for story_file in story_files:
+            facts.append((os.path.basename(story_file.path), story_file.start_nodes))
+            for node_name, flow_visitor in story_file.flows.items():
+                facts.append((node_name, flow_visitor.get_facts()))
+        return get_digest(repr(facts))
+
+    def _check_nodes(self, story_files: list[StoryFile]):
+        node_sources = {}
+        for story_file in story_files:
+            file_name = os.path.basename(story_file.path)
+            for node_name in story_file.flows:
+                node_sources[node_name] = file_name
+            self.sep_nodes.update(story_file.flows)
+            for start_node in story_file.start_nodes:
+                if self.start_node:
+                    self.error_rows.append(
+                        ' '.join([
+                            'There are more than one start nodes -',
+                            f'{start_node} in {file_name}',
+                            f'and {self.start_node} in {node_sources[self.start_node]}',
+                        ])
+                    )
+                else:
+                    self.start_node = start_node
         if not self.start_node:
             self.error_rows.append('The start node is not defined.')
             self.start_node = list(self.sep_nodes.keys())[0]
-        self.error_rows += nodes_visitor.error_rows
 
     def _check_flow(self):
-        visited_nodes = {}
-        for node in self.sep_nodes:
-            visitor = FlowVisitor()
-            visitor.visit(self.sep_nodes[node])
-            visited_nodes[node] = visitor
-        self.paths = self._find_paths(visited_nodes, self.start_node)
-        for path in self.paths:
-            self._check_vars(visited_nodes, path)
-        for node in visited_nodes:
-            self.media.update(visited_nodes[node].used_media)
-
-    def _find_paths(self, nodes: dict[str, FlowVisitor], start_node: str, path=[]):
-        path = path + [start_node]
-
-        if start_node not in nodes:
-            self.error_rows.append(f'The node {start_node} does not exist.')
-            return [path]
-        if not nodes[start_node].node_links:
-            return [path]
-
-        paths = []
-        for node_link in nodes[start_node].node_links:
-            if node_link not in path:
-                newpaths = self._find_paths(nodes, node_link, path)
-                for newpath in newpaths:
-                    paths.append(newpath)
-        return paths
-
-    def _check_vars(self, nodes: dict[str, FlowVisitor], path: list[str]):
-        declared_vars = set()
-        for node_name in path:
-            node_data = nodes.get(node_name)
-            if not node_data:
-                self.error_rows.append(f'The node {node_name} does not exist. The path = {" -> ".join(path)}')
+        self.graph = {node_name: visitor.node_links for node_name, visitor in self.sep_nodes.items()}
+        reachable = get_reachable(self.graph, self.start_node)
+        self._check_links(reachable)
+        self._check_vars(reachable)
+        for visitor in self.sep_nodes.values():
+            self.media.update(visitor.used_media)
+
+    def _check_links(self, reachable: list[str]):
+        for node_name in reachable:
+            for node_link in sorted(self.sep_nodes[node_name].node_links):
+                if node_link in self.sep_nodes or node_link in self._missing_nodes:
+                    continue
+                self._missing_nodes.add(node_link)
+                path = find_path(self.graph, self.start_node, node_link) or [node_link]
+                self.error_rows.append(f'The node {node_link} does not exist.')
+                self.error_rows.append(f'The node {node_link} does not exist. The path = {" -> ".join(path)}')
+
+    def _check_vars(self, reachable: list[str]):
+        '''
+        Check the variables with a forward dataflow over the jump graph instead of walking every path.
+        `maybe_declared` holds the variables declared on some path to the node,
+        `surely_declared` the ones declared on every path to it.
+        Inside a cycle every other node of the cycle may run before the node, except for the start node,
+        which always comes first. `surely_declared` of the nodes of a cycle is narrowed from every
+        variable until it stops changing.
+        '''
+        self._declarations = {}
+        parents: dict[str, list[str]] = {node_name: [] for node_name in reachable}
+        for node_name in reachable:
+            for declaration in self.sep_nodes[node_name].declared_vars:
+                self._declarations.setdefault(declaration, set()).add(node_name)
+            for node_link in self.graph[node_name]:
+                if node_link in parents:
+                    parents[node_link].append(node_name)
+
+        maybe_declared: dict[str, set[str]] = {}
+        surely_declared: dict[str, set[str]] = {}
+        for component in get_components(self.graph, reachable):
+            members = set(component)
+            # The variables declared on some and on every path into the component
+            maybe_entry = set()
+            surely_entries: dict[str, list[set[str]]] = {}
+            if self.start_node in members:
+                surely_entries[self.start_node] = [set()]
+            for node_name in component:
+                for parent in parents[node_name]:
+                    if parent not in members:
+                        declared_vars = self.sep_nodes[parent].declared_vars
+                        maybe_entry |= maybe_declared[parent] | declared_vars
+                        surely_entries.setdefault(node_name, []).append(surely_declared[parent] | declared_vars)
+            declaration_counts = Counter(
+                declaration for node_name in component for declaration in self.sep_nodes[node_name].declared_vars
+            )
+            for node_name in component:
+                declared_vars = self.sep_nodes[node_name].declared_vars
+                cycle_vars = {
+                    declaration for declaration, count in declaration_counts.items()
+                    if count > (declaration in declared_vars)
+                }
+                maybe_declared[node_name] = maybe_entry | cycle_vars if node_name != self.start_node else set()
+            self._narrow_surely_declared(component, parents, surely_entries, surely_declared)
+            for node_name in component:
+                self._check_node_vars(node_name, maybe_declared[node_name], surely_declared[node_name])
+
+    def _narrow_surely_declared(
+        self,
+        component: list[str],
+        parents: dict[str, list[str]],
+        surely_entries: dict[str, list[set[str]]],
+        surely_declared: dict[str, set[str]],
+    ):
+        members = set(component)
+        all_vars = set(self._declarations)
+        for node_name in component:
+            surely_declared[node_name] = set(all_vars)
+        changed = True
+        while changed:
+            changed = False
+            for node_name in component:
+                incoming = surely_entries.get(node_name, []) + [
+                    surely_declared[parent] | self.sep_nodes[parent].declared_vars
+                    for parent in parents[node_name] if parent in members
+                ]
+                narrowed = set.intersection(*incoming) if incoming else set()
+                if narrowed != surely_declared[node_name]:
+                    surely_declared[node_name] = narrowed
+                    changed = True
+
+    def _check_node_vars(self, node_name: str, maybe_declared: set[str], surely_declared: set[str]):
+        node_data = self.sep_nodes[node_name]
+        for declaration in sorted(node_data.declared_vars & maybe_declared):
+            path = find_path(
+                self.graph, self.start_node, node_name, through=self._declarations[declaration] - {node_name}
+            )
+            self.error_rows.append(
+                ' '.join([
+                    f'Node - {node_name}.',
+                    f'The variable {declaration} is already declared',
+                    f'in the path = {" -> ".join(path or [node_name])}'
+                ])
+            )
+        for usage_var in sorted(node_data.used_vars - node_data.declared_vars - surely_declared):
+            path = find_path(self.graph, self.start_node, node_name, avoid=self._declarations.get(usage_var, set()))
+            if path is None:
+                # Every path to the node declares the variable
                 continue
-            for declaration in node_data.declared_vars:
-                if declaration in declared_vars:
-                    self.error_rows.append(
-                        ' '.join([
-                            f'Node - {node_name}.',
-                            f'The variable {declaration} is already declared',
-                            f'in the path = {" -> ".join(path)}'
-                        ])
-                    )
-                declared_vars.add(declaration)
-            for usage_var in node_data.used_vars:
-                if usage_var not in declared_vars:
-                    self.error_rows.append(
-                        ' '.join([
-                            f'Node - {node_name}.',
-                            f'The variable {usage_var} is not declared',
-                            f'in the path = {" -> ".join(path)}'
-                        ])
-                    )
-            for local_var in node_data.used_vars_in_node:
-                if local_var not in node_data.declared_vars_in_node:
-                    self.error_rows.append(
-                        ' '.join([
-                            f'Node - {node_name}.',
-                            f'The variable {local_var} is not declared',
-                            f'in the node {node_name}'
-                        ])
-                    )
+            self.error_rows.append(
+                ' '.join([
+                    f'Node - {node_name}.',
+                    f'The variable {usage_var} is not declared',
+                    f'in the path = {" -> ".join(path)}'
+                ])
+            )
+        for local_var in sorted(node_data.used_vars_in_node - node_data.declared_vars_in_node):
+            self.error_rows.append(
+                ' '.join([
+                    f'Node - {node_name}.',
+                    f'The variable {local_var} is not declared',
+                    f'in the node {node_name}'
+                ])
+            )
 
 
 class YabScriptBuilder():
@@ -740,103 +1061,110 @@ class YabScriptBuilder():
         self,
         story_paths: list[str | os.PathLike],
         setting_path: str | os.PathLike,
+        build_cache: BuildCache | None = None,
+        jobs: int = 1,
+        line_ids: str = 'uuid',
+        media_dry_run: bool = False,
+        strict: bool = False,
     ):
         config.logger.info('Parsing the script.')
         self.error_rows = []
-        self.parser = self._get_lark_parser()
-        self.settings = self._get_settings(setting_path)
-        self.full_script = ''
+        self.line_ids = line_ids
+        self.strict = strict
+        self.media_dry_run = media_dry_run
+        with profiling.stage('settings'):
+            self.settings = self._get_settings(setting_path)
+        self.build_cache = build_cache
         self.scripts_with_idents = {}
+        # The project files the build changed itself
+        self.written_paths: set[str] = set()
+        self.story_files = []
         self.start_node = None
         self.sep_nodes = {}
-        self.tg_script = {}
-        self.paths = []
+        self.graph: Graph = {}
         self.media = set()
 
         if self.error_rows:
             return
-        for path in story_paths:
-            with open(path, 'r') as f:
-                script_rows = self._add_idents(f.readlines())
-                try:
-                    self.parser.parse(
-                        ''.join(script_rows),
-                        on_error=self._make_error_parser_func(path.split('/')[-1])
-                    )
-                except exceptions.LarkError:
-                    self.error_rows.append(f'The script {path} is incorrect.')
-                else:
-                    self.full_script += ''.join(script_rows)
-                    self.scripts_with_idents[path] = script_rows
-        if self.error_rows:
+        with profiling.stage('story files'):
+            self.story_files = self._get_story_files(story_paths, jobs)
+        for story_file in self.story_files:
+            self.error_rows += story_file.error_rows
+        if not all(story_file.is_parsed for story_file in self.story_files):
             return
-        self.parsed_script = self.parser.parse(self.full_script)
-        self._check()
-        for node in self.sep_nodes:
-            tg_transformer = TgTransformer()
-            self.tg_script[node] = tg_transformer.transform(self.sep_nodes[node])
-            self.error_rows += tg_transformer._error_rows
-        self._serilize_tg_script()
+        with profiling.stage('check'):
+            self._check()
+        with profiling.stage('script'):
+            self._serilize_tg_script()
         self._post_process()
+        if self.build_cache:
+            self.build_cache.prune(story_paths)
 
-    def _add_idents(self, script_rows: list[str]) -> list[str]:
-        is_body = False
-        line_re = re.compile(r'^[^<\/\n].+')
-        ident_re = re.compile(r'(?<!\\)#\s*line\s*:\s*[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
-        comment_re = r'(?<!\\)//'
-        tags_re = r'(?<!\\)\[.*?\s*(?<!\\)]'
-        idented_script_rows = []
-        for row in script_rows:
-            if row.strip() == '---':
-                is_body = True
-                idented_script_rows.append(row)
-                continue
-            elif row.strip() == '===':
-                is_body = False
-                idented_script_rows.append(row)
-                continue
-            if not is_body:
-                idented_script_rows.append(row)
-                continue
-
-            base_line_without_tags = re.sub(tags_re, '', row)
-            _, *comments = re.split(comment_re, base_line_without_tags)
-            comment = f'//{"//".join(comments)}'.strip() if comments else ''
-            base_line = row.replace('\n', '')
-            base_line = base_line.strip(comment)
-
-            if line_re.match(row.strip()) and not ident_re.search(row):
-                ident = str(uuid4())
-                idented_script_rows.append(
-                    f'{base_line} #line:{ident}' + comment + '\n'
-                )
-            elif ident_re.search(row):
-                ident = ident_re.search(row)
-                idented_script_rows.append(row)
+    def _get_story_files(self, story_paths: list[str | os.PathLike], jobs: int) -> list[StoryFile]:
+        story_files = {}
+        new_scripts = {}
+        for path in story_paths:
+            with open(path, 'r') as f:
+                script_rows = f.readlines()
+            story_file = None
+            if self.build_cache:
+                story_file = self.build_cache.load_story_file(path, get_digest(''.join(script_rows)))
+            if story_file:
+                story_files[path] = story_file
             else:
-                idented_script_rows.append(row)
-        return idented_script_rows
-
-    def _get_lark_parser(self) -> Lark:
-        with open(config.LARK_GRAMMAR_PATH, 'r') as f:
-            grammar = f.read()
-
-        class TreeIndenter(Indenter):
-            NL_type = '_NL'
-            OPEN_PAREN_types = []
-            CLOSE_PAREN_types = []
-            INDENT_type = '_INDENT'
-            DEDENT_type = '_DEDENT'
-            tab_len = 4
-
-        return Lark(grammar, parser='lalr', postlex=TreeIndenter(), start='nodes', debug=True)
+                new_scripts[path] = script_rows
+        if self.build_cache:
+            config.logger.info(f'Reused {len(story_files)} of {len(story_paths)} story files from the build cache.')
+
+        if new_scripts:
+            # Forked workers inherit the parser, the others load it from the grammar cache
+            with profiling.stage('grammar'):
+                grammar.get_yarn_parser()
+        if jobs > 1 and len(new_scripts) > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(jobs, len(new_scripts)),
+                initializer=_init_worker,
+                initargs=(config.USE_GRAMMAR_CACHE,),
+            ) as executor:
+                compiled_files = list(executor.map(
+                    compile_story_file,
+                    new_scripts.keys(),
+                    new_scripts.values(),
+                    repeat(self.line_ids),
+                    repeat(self.strict),
+                ))
+        else:
+            compiled_files = list(map(
+                compile_story_file,
+                new_scripts.keys(),
+                new_scripts.values(),
+                repeat(self.line_ids),
+                repeat(self.strict),
+            ))
+
+        for path in story_files:
+            profiling.add_story_file(story_files[path], cached=True)
+        for path, (script_rows, added_idents, story_file) in zip(new_scripts, compiled_files):
+            profiling.add_story_file(story_file)
+            story_files[path] = story_file
+            if story_file.is_parsed:
+                if added_idents:
+                    self.scripts_with_idents[path] = (script_rows, added_idents)
+                if self.build_cache:
+                    self.build_cache.save_story_file(path, story_file)
+        return [story_files[path] for path in story_paths]
 
     def _check(self):
-        check_visitor = YabScriptChecker(self)
+        signature = YabScriptChecker.get_signature(self.story_files)
+        check_visitor = self.build_cache.load_check(signature) if self.build_cache else None
+        if not check_visitor:
+            check_visitor = YabScriptChecker(self.story_files)
+            if self.build_cache:
+                self.build_cache.save_check(signature, check_visitor)
         self.error_rows += check_visitor.error_rows
         self.sep_nodes = check_visitor.sep_nodes
         self.start_node = check_visitor.start_node
-        self.paths = check_visitor.paths
+        self.graph = check_visitor.graph
         self.media = check_visitor.media
 
     def _get_settings(self, setting_path: str | os.PathLike) -> schemas.settings.ScriptSettings:
@@ -857,67 +1185,39 @@ class YabScriptBuilder():
             return
         return result
 
-    def _make_error_parser_func(self, file_name: str):
-        def error_func(error: exceptions.LarkError, file_name: str = file_name):
-            if isinstance(error, exceptions.UnexpectedToken):
-                self.error_rows.append(
-                    ' '.join([
-                        f'Error in {file_name} line {error.line}',
-                        f'column {error.column}: expected tokens {error.expected}',
-                        f'but got "{error.token}"',
-                    ])
-                )
-                return True
-            return False
-        return error_func
-
     def _post_process(self):
-        self._change_source()
-        self._add_media()
+        with profiling.stage('source'):
+            self._change_source()
+        with profiling.stage('media'):
+            self.written_paths.update(self._add_media())
 
     def _change_source(self):
-        for path in self.scripts_with_idents:
-            with open(path, 'w') as f:
-                f.writelines(self.scripts_with_idents[path])
-
-    def _add_media(self):
-        exist_media = set(os.listdir(config.MEDIA_PATH))
-        for_deletion = exist_media - self.media
-        new_media = self.media - exist_media
-
-        for media in for_deletion:
-            os.remove(os.path.join(config.MEDIA_PATH, media))
-
-        for media in new_media:
-            if not guess_type(media)[0]:
-                media_content = b''
-            elif guess_type(media)[0] == 'image/jpeg':
-                with open(config.EXAMPLE_JPG_PATH, 'rb') as f:
-                    media_content = f.read()
-            elif guess_type(media)[0] == 'image/png':
-                with open(config.EXAMPLE_PNG_PATH, 'rb') as f:
-                    media_content = f.read()
-            elif guess_type(media)[0] == 'audio/ogg':
-                with open(config.EXAMPLE_OOG_PATH, 'rb') as f:
-                    media_content = f.read()
-            elif guess_type(media)[0] == 'video/mp4':
-                with open(config.EXAMPLE_MP4_PATH, 'rb') as f:
-                    media_content = f.read()
-            elif guess_type(media)[0] == 'video/quicktime':
-                with open(config.EXAMPLE_MOV_PATH, 'rb') as f:
-                    media_content = f.read()
-            else:
-                media_content = b''
-
-            with open(os.path.join(config.MEDIA_PATH, media), 'wb') as f:
-                f.write(media_content)
+        '''
+        Write the new line idents into the story files that lack some.
+        The other files are not touched.
+        '''
+        for path, (script_rows, added_idents) in self.scripts_with_idents.items():
+            with open_atomic(path, 'w') as f:
+                f.writelines(script_rows)
+            self.written_paths.add(path)
+            config.logger.info(f'Added {added_idents} line idents to {path}.')
+
+    def _add_media(self) -> list[str]:
+        '''
+        Sync the media folder with the used media and return the paths of the created and removed files.
+        '''
+        new_media, for_deletion = sync_media(self.media, dry_run=self.media_dry_run)
+        if self.media_dry_run:
+            return []
+        return [os.path.join(config.MEDIA_PATH, media) for media in new_media + for_deletion]
 
     def _serilize_tg_script(self):
         self.seriliazed_tg_script = schemas.script.Script(
             settings=self.settings,
             start_node=self.start_node,
         )
-        for node_name in self.tg_script:
-            tg_serializer = TgSerializer()
-            tg_serializer.visit(self.tg_script[node_name])
-            self.seriliazed_tg_script.nodes[node_name] = tg_serializer._script
+        for story_file in self.story_files:
+            self.seriliazed_tg_script.nodes.update(story_file.nodes)
+        if self.strict:
+            # The nodes are added after the script is made, so the whole script is validated once they are in
+            schemas.script.Script.model_validate(self.seriliazed_tg_script.model_dump())
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import pickle
+import sys
+from typing import Any
+
+from yab_parser import config
+from yab_parser.files import open_atomic
+
+CACHE_VERSION = 1
+SALT_SOURCES = [
+    config.LARK_GRAMMAR_PATH,
+    os.path.join(config.current_dir_path, 'builder.py'),
+    os.path.join(config.current_dir_path, 'program.py'),
+    os.path.join(config.current_dir_path, 'tg_text.py'),
+    os.path.join(config.current_dir_path, 'line_ids.py'),
+    os.path.join(config.current_dir_path, 'graph.py'),
+    os.path.join(config.current_dir_path, 'schemas', 'script.py'),
+]
+
+
+def get_digest(content: str | bytes) -> str:
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_build_cache_path(project_path: str | os.PathLike = '.') -> str:
+    '''
+    Return the build cache of the project, a folder of config.BUILD_CACHE_DIR named after the project path.
+    '''
+    return os.path.join(config.BUILD_CACHE_DIR, get_digest(os.path.abspath(project_path))[:16])
+
+
+class BuildCache():
+    '''
+    Parsed and serialized story files from the previous builds, keyed by content hashes.
+    Entries made by another version of the grammar or the builder are ignored.
+    The entries are pickles, which run code when they are loaded, so the cache must only
+    hold entries of the current user: it is never committed or shared with a project.
+    '''
+    def __init__(self, cache_path: str | os.PathLike | None = None, salt: str = ''):
+        self.cache_path = cache_path or get_build_cache_path()
+        self.salt = self._get_salt(salt)
+
+    def _get_salt(self, salt: str) -> str:
+        hasher = hashlib.sha256(f'{CACHE_VERSION}:{sys.version_info[:2]}:{salt}'.encode('utf-8'))
+        for path in SALT_SOURCES:
+            with open(path, 'rb') as f:
+                hasher.update(f.read())
+        return hasher.hexdigest()
+
+    def load_story_file(self, path: str | os.PathLike, digest: str):
+        return self._load(self._get_story_file_name(path), digest)
+
+    def save_story_file(self, path: str | os.PathLike, story_file):
+        self._save(self._get_story_file_name(path), story_file.digest, story_file)
+
+    def load_check(self, signature: str):
+        return self._load('check.pickle', signature)
+
+    def save_check(self, signature: str, checker):
+        self._save('check.pickle', signature, checker)
+
+    def prune(self, story_paths: list[str | os.PathLike]):
+        '''
+        Remove the entries of story files that are no longer in the project.
+        '''
+        if not os.path.isdir(self.cache_path):
+            return
+        used_names = {self._get_story_file_name(path) for path in story_paths}
+        for name in os.listdir(self.cache_path):
+            if name.startswith('story_') and name not in used_names:
+                os.remove(os.path.join(self.cache_path, name))
+
+    def _get_story_file_name(self, path: str | os.PathLike) -> str:
+        return f'story_{get_digest(os.path.abspath(path))[:16]}.pickle'
+
+    def _load(self, name: str, key: str):
+        try:
+            with open(os.path.join(self.cache_path, name), 'rb') as f:
+                salt, entry_key, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            config.logger.warning(f'The build cache entry {name} is broken: {e}')
+            return None
+        if salt != self.salt or entry_key != key:
+            return None
+        return value
+
+    def _save(self, name: str, key: str, value):
+        with open_atomic(os.path.join(self.cache_path, name)) as f:
+            pickle.dump((self.salt, key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class MemoryBuildCache(BuildCache):
+    '''
+    Keep the entries of a long running process in memory, in front of an optional cache on disk.
+    '''
+    def __init__(self, build_cache: BuildCache | None = None):
+        self.build_cache = build_cache
+        self._entries: dict[str, tuple[str, Any]] = {}
+
+    def prune(self, story_paths: list[str | os.PathLike]):
+        used_names = {self._get_story_file_name(path) for path in story_paths}
+        for name in list(self._entries):
+            if name.startswith('story_') and name not in used_names:
+                del self._entries[name]
+        if self.build_cache:
+            self.build_cache.prune(story_paths)
+
+    def _load(self, name: str, key: str):
+        entry = self._entries.get(name)
+        if entry and entry[0] == key:
+            return entry[1]
+        value = self.build_cache._load(name, key) if self.build_cache else None
+        if value is not None:
+            self._entries[name] = (key, value)
+        return value
+
+    def _save(self, name: str, key: str, value):
+        self._entries[name] = (key, value)
+        if self.build_cache:
+            self.build_cache._save(name, key, value)
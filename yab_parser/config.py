@@ -23,6 +23,15 @@ EXAMPLE_OOG_PATH = os.path.join(EXAMPLE_MEDIA_DIR, 'example.ogg')
 EXAMPLE_MP4_PATH = os.path.join(EXAMPLE_MEDIA_DIR, 'example.mp4')
 EXAMPLE_MOV_PATH = os.path.join(EXAMPLE_MEDIA_DIR, 'example.mov')
 
+if sys.platform == 'win32':
+    USER_CACHE_DIR = os.getenv('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local')
+else:
+    USER_CACHE_DIR = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+GRAMMAR_CACHE_DIR = os.getenv('YAB_GRAMMAR_CACHE_DIR') or os.path.join(USER_CACHE_DIR, 'yab_parser')
+USE_GRAMMAR_CACHE = os.getenv('YAB_GRAMMAR_CACHE', '1').lower() not in ('0', 'false', 'no')
+# The build caches hold pickles, so they are kept out of the projects that are shared with others
+BUILD_CACHE_DIR = os.getenv('YAB_BUILD_CACHE_DIR') or os.path.join(USER_CACHE_DIR, 'yab_parser', 'builds')
+
 
 STORY_PATH = 'Story'
 MEDIA_PATH = 'Media'
@@ -31,11 +40,9 @@ SETTINGS_PATH = os.path.join('Settings', 'settings.yaml')
 NESSESSARY_PATHS = [STORY_PATH, SETTINGS_PATH]
 BUILD_PATH = 'build.yab'
 BUILD_INFO_PATH = 'build_info.json'
+# Where the build cache was kept before it moved to BUILD_CACHE_DIR
+OLD_BUILD_CACHE_PATH = '.yab_cache'
+PROFILE_PATH = 'build_profile.json'
+PROFILE_STATS_PATH = 'build_profile.pstats'
 
 SUPPORTED_LANGUAGES = ['ru', 'en']
-
-BABEL_CFG = '''[extractors]
-yab = yab_parser.babel_extractors:extract_yab_json
-
-[yab: **/script.json]
-'''
\ No newline at end of file
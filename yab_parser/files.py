@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+# The mode open() gives to new files. The umask can only be read by setting it,
+# so it is read once on import, before the build starts any threads.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+NEW_FILE_MODE = 0o666 & ~_UMASK
+
+
+@contextmanager
+def open_atomic(path: str | os.PathLike, mode: str = 'wb') -> Iterator[IO]:
+    '''
+    Open a temporary file next to the path and put it in place of the path when the block ends.
+    The file keeps the mode of the one it replaces, a new file gets the mode open() would give it.
+    If the block fails the path is left as it was.
+    '''
+    dir_path = os.path.dirname(path) or '.'
+    os.makedirs(dir_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        # mkstemp makes the file readable only by the owner
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        else:
+            os.chmod(tmp_path, NEW_FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_atomic(path: str | os.PathLike, content: str | bytes):
+    with open_atomic(path, 'w' if isinstance(content, str) else 'wb') as f:
+        f.write(content)
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import threading
+
+import lark
+from lark import Lark
+from lark.indenter import Indenter
+
+from yab_parser import config
+
+
+class TreeIndenter(Indenter):
+    NL_type = '_NL'
+    OPEN_PAREN_types = []
+    CLOSE_PAREN_types = []
+    INDENT_type = '_INDENT'
+    DEDENT_type = '_DEDENT'
+    tab_len = 4
+
+    def process(self, stream):
+        # Lark keeps one postlexer per parser, so the indent state lives in a fresh
+        # indenter per parse call and a shared parser can be used from several threads.
+        return Indenter.process(TreeIndenter(), stream)
+
+
+def _read_grammar() -> str:
+    with open(config.LARK_GRAMMAR_PATH, 'r') as f:
+        return f.read()
+
+
+def _get_cache_path(grammar: str, start: str, use_cache: bool) -> str | None:
+    '''
+    Return the path of the compiled parser for the given grammar and start rule.
+    The name depends on the grammar text and the lark version,
+    so a changed grammar never picks up stale tables.
+    '''
+    if not use_cache:
+        return None
+    digest = hashlib.sha256(f'{lark.__version__}:{start}:{grammar}'.encode('utf-8')).hexdigest()
+    try:
+        os.makedirs(config.GRAMMAR_CACHE_DIR, exist_ok=True)
+    except OSError as e:
+        config.logger.warning(f'The grammar cache is disabled: {e}')
+        return None
+    return os.path.join(config.GRAMMAR_CACHE_DIR, f'{start}_{digest[:16]}.lark')
+
+
+def build_yarn_parser(use_cache: bool | None = None) -> Lark:
+    if use_cache is None:
+        use_cache = config.USE_GRAMMAR_CACHE
+    grammar = _read_grammar()
+    return Lark(
+        grammar,
+        parser='lalr',
+        postlex=TreeIndenter(),
+        start='nodes',
+        debug=True,
+        cache=_get_cache_path(grammar, 'nodes', use_cache) or False,
+    )
+
+
+def build_text_parser(use_cache: bool | None = None) -> Lark:
+    if use_cache is None:
+        use_cache = config.USE_GRAMMAR_CACHE
+    grammar = _read_grammar()
+    return Lark(
+        grammar,
+        parser='lalr',
+        start='formated_text',
+        debug=True,
+        cache=_get_cache_path(grammar, 'formated_text', use_cache) or False,
+    )
+
+
+_PARSER_FACTORIES = {
+    'yarn': build_yarn_parser,
+    'text': build_text_parser,
+}
+_parsers: dict[str, Lark] = {}
+_parsers_lock = threading.Lock()
+
+
+def get_parser(name: str) -> Lark:
+    '''
+    Return the shared parser registered under the name.
+    The parser is built on first use and then reused by the whole process.
+    '''
+    parser = _parsers.get(name)
+    if parser is None:
+        with _parsers_lock:
+            parser = _parsers.get(name)
+            if parser is None:
+                parser = _PARSER_FACTORIES[name]()
+                _parsers[name] = parser
+    return parser
+
+
+def get_yarn_parser() -> Lark:
+    return get_parser('yarn')
+
+
+def get_text_parser() -> Lark:
+    return get_parser('text')
+
+
+def clear_parsers():
+    with _parsers_lock:
+        _parsers.clear()
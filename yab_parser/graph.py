@@ -0,0 +1,135 @@
+from collections import deque
+from typing import AbstractSet, Iterator
+
+Graph = dict[str, set[str]]
+
+
+def get_reachable(graph: Graph, start: str) -> list[str]:
+    '''
+    Return the nodes of the graph reachable from the start node in BFS order.
+    Links to nodes missing from the graph are not followed.
+    '''
+    if start not in graph:
+        return []
+    reachable = [start]
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        for link in sorted(graph[queue.popleft()]):
+            if link in graph and link not in seen:
+                seen.add(link)
+                reachable.append(link)
+                queue.append(link)
+    return reachable
+
+
+def get_components(graph: Graph, nodes: list[str]) -> list[list[str]]:
+    '''
+    Return the strongly connected components of the given nodes in topological order.
+    It is the iterative version of Tarjan's algorithm.
+    '''
+    index: dict[str, int] = {}
+    low_link: dict[str, int] = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low_link[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(sorted(link for link in graph[root] if link in graph)))]
+        while work:
+            node, links = work[-1]
+            for link in links:
+                if link not in index:
+                    index[link] = low_link[link] = len(index)
+                    stack.append(link)
+                    on_stack.add(link)
+                    work.append((link, iter(sorted(next_link for next_link in graph[link] if next_link in graph))))
+                    break
+                if link in on_stack:
+                    low_link[node] = min(low_link[node], index[link])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[node])
+                if low_link[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    components.reverse()
+    return components
+
+
+def find_path(
+    graph: Graph,
+    start: str,
+    target: str,
+    avoid: AbstractSet[str] = frozenset(),
+    through: AbstractSet[str] = frozenset(),
+) -> list[str] | None:
+    '''
+    Return the shortest path from the start to the target node.
+    The nodes before the target must not be in `avoid`,
+    and if `through` is given, one of them must be in it.
+    '''
+    if start in avoid:
+        return None
+    first_state = (start, start in through and start != target)
+    parents: dict[tuple[str, bool], tuple[str, bool] | None] = {first_state: None}
+    queue = deque([first_state])
+    while queue:
+        state = queue.popleft()
+        node, is_through = state
+        if node == target and (is_through or not through):
+            path = []
+            step: tuple[str, bool] | None = state
+            while step:
+                path.append(step[0])
+                step = parents[step]
+            return path[::-1]
+        if node == target or node not in graph:
+            continue
+        for link in sorted(graph[node]):
+            if link in avoid and link != target:
+                continue
+            next_state = (link, is_through or (link in through and link != target))
+            if next_state not in parents:
+                parents[next_state] = state
+                queue.append(next_state)
+    return None
+
+
+def iter_paths(graph: Graph, start: str) -> Iterator[list[str]]:
+    '''
+    Yield the simple paths from the start node that end in a node without links
+    or in a node missing from the graph.
+    '''
+    if not graph.get(start):
+        yield [start]
+        return
+    path = [start]
+    on_path = {start}
+    work = [iter(sorted(graph[start]))]
+    while work:
+        for link in work[-1]:
+            if link in on_path:
+                continue
+            if not graph.get(link):
+                yield path + [link]
+                continue
+            path.append(link)
+            on_path.add(link)
+            work.append(iter(sorted(graph[link])))
+            break
+        else:
+            work.pop()
+            on_path.discard(path.pop())
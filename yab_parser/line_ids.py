@@ -0,0 +1,47 @@
+import hashlib
+from uuid import NAMESPACE_URL, uuid4, uuid5
+
+# uuid - random ids, every build gives new ones
+# stable - hashes of the node title and the position of the line
+# compact - a counter per node
+LINE_ID_MODES = ['uuid', 'stable', 'compact']
+IDENT_NAMESPACE = uuid5(NAMESPACE_URL, 'https://github.com/kisapisastudio/yab_parser')
+
+
+def _to_base36(number: int) -> str:
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    result = ''
+    while number:
+        number, digit = divmod(number, 36)
+        result = digits[digit] + result
+    return result or '0'
+
+
+class LineIds():
+    '''
+    Make the ids of the lines of one node.
+    An instance is shared by the serializers of the node and its nested branches.
+    '''
+    def __init__(self, mode: str = 'uuid', seed: str = ''):
+        if mode not in LINE_ID_MODES:
+            raise ValueError(f'Unknown line id mode {mode}, expected one of {LINE_ID_MODES}.')
+        self.mode = mode
+        self.seed = seed
+        self.count = 0
+
+    def __call__(self) -> str:
+        if self.mode == 'uuid':
+            return str(uuid4())
+        self.count += 1
+        if self.mode == 'compact':
+            return _to_base36(self.count)
+        return hashlib.sha1(f'{self.seed}:{self.count}'.encode('utf-8')).hexdigest()[:12]
+
+
+def make_ident(mode: str, seed: str) -> str:
+    '''
+    Return a `#line:` ident for a source row, `seed` identifies the row in the project.
+    '''
+    if mode == 'uuid':
+        return str(uuid4())
+    return str(uuid5(IDENT_NAMESPACE, seed))
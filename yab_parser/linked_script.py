@@ -0,0 +1,202 @@
+import json
+import zipfile
+from typing import Any
+
+from yab_parser import config
+from yab_parser.program import compile_program
+from yab_parser.schemas.script import CommandType, FlowControl, Message, Node, Script, VariableCommand
+
+LINKED_SCRIPT_NAME = 'script_linked.json'
+LINKED_FORMAT_VERSION = 1
+
+# Every line is a list that starts with its kind, the links are positions in the lines
+# of the node and None ends the node. The fall-through links are resolved, so an option
+# or a branch always has its own link:
+#
+#   ['message', message_type, speaker, text, media, [[text, program, link], ...], next]
+#   ['command', command_type, args, node, next], node is the index of the node of a jump
+#   ['variable', command_type, name, value, program, next]
+#   ['flow', [[program, link], ...], else_link, next], the if and elseif blocks in order
+MESSAGE = 'message'
+COMMAND = 'command'
+VARIABLE = 'variable'
+FLOW = 'flow'
+NODE_FIELDS = ['title', 'checkpoint_name', 'reaction', 'wait', 'time_for_status', 'start_on_command']
+
+
+def _get_program(program, condition):
+    # A script loaded from script.json only has the trees
+    if program is None and condition is not None:
+        return compile_program(condition)
+    return program
+
+
+def _link_line(line, indexes: dict[str | None, int], node_indexes: dict[str, int]) -> list:
+    next_line = indexes.get(line.next_line_id)
+    if isinstance(line, Message):
+        options = [
+            [
+                option.text,
+                _get_program(option.program, option.condition),
+                indexes.get(option.link or line.next_line_id),
+            ]
+            for option in line.options
+        ]
+        return [MESSAGE, line.message_type.value, line.speaker, line.text, line.media, options, next_line]
+    if isinstance(line, VariableCommand):
+        program = _get_program(line.program, line.calculation)
+        return [VARIABLE, line.command_type.value, line.name, line.value, program, next_line]
+    if isinstance(line, FlowControl):
+        blocks = [
+            [_get_program(block.program, block.condition), indexes.get(block.link or line.next_line_id)]
+            for block in ([line.if_block] if line.if_block else []) + line.elif_blocks
+        ]
+        else_link = indexes.get((line.else_block.link if line.else_block else None) or line.next_line_id)
+        return [FLOW, blocks, else_link, next_line]
+    node = None
+    if line.command_type == CommandType.jump:
+        node = node_indexes.get(line.args['node_name'])
+    return [COMMAND, line.command_type.value, line.args, node, next_line]
+
+
+def _link_node(name: str, node: Node, node_indexes: dict[str, int]) -> dict:
+    # The flow starts at the empty line id, it gets the first position
+    line_ids = sorted(node.flow, key=lambda line_id: line_id != '')
+    # The links of the lines that end the node are None
+    indexes: dict[str | None, int] = {line_id: index for index, line_id in enumerate(line_ids)}
+    linked_node: dict[str, Any] = {'name': name}
+    for field in NODE_FIELDS:
+        linked_node[field] = getattr(node, field)
+    linked_node['line_ids'] = line_ids
+    linked_node['lines'] = [_link_line(node.flow[line_id], indexes, node_indexes) for line_id in line_ids]
+    return linked_node
+
+
+def dump_linked_script(script: Script) -> bytes:
+    '''
+    Encode the script with the lines of every node in a list and the links and jumps as positions.
+    The line ids are kept in a list next to the lines.
+    '''
+    node_indexes = {name: index for index, name in enumerate(script.nodes)}
+    linked_script = {
+        'version': LINKED_FORMAT_VERSION,
+        'settings': script.settings.model_dump(mode='json'),
+        'start_node': node_indexes.get(script.start_node),
+        'nodes': [_link_node(name, node, node_indexes) for name, node in script.nodes.items()],
+    }
+    return json.dumps(linked_script, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class LinkedOption():
+    __slots__ = ('text', 'program', 'link')
+
+    def __init__(self, text: str, program: list | None, link: int | None):
+        self.text = text
+        self.program = program
+        self.link = link
+
+
+class LinkedMessage():
+    __slots__ = ('message_type', 'speaker', 'text', 'media', 'options', 'next')
+    kind = MESSAGE
+
+    def __init__(
+        self,
+        message_type: str,
+        speaker: str | None,
+        text: str | None,
+        media: str | None,
+        options: list,
+        next_line: int | None,
+    ):
+        self.message_type = message_type
+        self.speaker = speaker
+        self.text = text
+        self.media = media
+        self.options = [LinkedOption(*option) for option in options]
+        self.next = next_line
+
+
+class LinkedCommand():
+    __slots__ = ('command_type', 'args', 'node', 'next')
+    kind = COMMAND
+
+    def __init__(self, command_type: str, args: dict | None, node: int | None, next_line: int | None):
+        self.command_type = command_type
+        self.args = args
+        self.node = node
+        self.next = next_line
+
+
+class LinkedVariableCommand():
+    __slots__ = ('command_type', 'name', 'value', 'program', 'next')
+    kind = VARIABLE
+
+    def __init__(self, command_type: str, name: str, value: Any, program: list | None, next_line: int | None):
+        self.command_type = command_type
+        self.name = name
+        self.value = value
+        self.program = program
+        self.next = next_line
+
+
+class LinkedBlock():
+    __slots__ = ('program', 'link')
+
+    def __init__(self, program: list, link: int | None):
+        self.program = program
+        self.link = link
+
+
+class LinkedFlowControl():
+    __slots__ = ('blocks', 'else_link', 'next')
+    kind = FLOW
+
+    def __init__(self, blocks: list, else_link: int | None, next_line: int | None):
+        self.blocks = [LinkedBlock(*block) for block in blocks]
+        self.else_link = else_link
+        self.next = next_line
+
+
+LINE_CLASSES = {
+    MESSAGE: LinkedMessage,
+    COMMAND: LinkedCommand,
+    VARIABLE: LinkedVariableCommand,
+    FLOW: LinkedFlowControl,
+}
+
+
+class LinkedNode():
+    __slots__ = ('name', *NODE_FIELDS, 'line_ids', 'lines')
+
+    def __init__(self, node: dict):
+        self.name = node['name']
+        for field in NODE_FIELDS:
+            setattr(self, field, node[field])
+        self.line_ids = node['line_ids']
+        self.lines = [LINE_CLASSES[line[0]](*line[1:]) for line in node['lines']]
+
+
+class LinkedScript():
+    '''
+    A linked script in plain objects: script.nodes[index].lines[position].
+    The settings stay the dict of the file.
+    '''
+    __slots__ = ('settings', 'start_node', 'nodes', 'node_indexes')
+
+    def __init__(self, linked_script: dict):
+        if linked_script.get('version') != LINKED_FORMAT_VERSION:
+            raise ValueError(f'Unsupported linked script version {linked_script.get("version")}.')
+        self.settings = linked_script['settings']
+        self.start_node = linked_script['start_node']
+        self.nodes = [LinkedNode(node) for node in linked_script['nodes']]
+        self.node_indexes = {node.name: index for index, node in enumerate(self.nodes)}
+
+
+def load_linked_script(data: bytes | str) -> LinkedScript:
+    return LinkedScript(json.loads(data))
+
+
+def load_build_linked_script(build_path: str = config.BUILD_PATH) -> LinkedScript:
+    with zipfile.ZipFile(build_path, 'r') as z:
+        return load_linked_script(z.read(LINKED_SCRIPT_NAME))
@@ -1,19 +1,33 @@
-from yab_parser import builder, checker, config
+from yab_parser import builder, checker, config, graph, packager, profiling, translation
+from yab_parser.binary_script import dump_script
+from yab_parser.cache import BuildCache
+from yab_parser.linked_script import dump_linked_script
 from yab_parser.schemas.script import ScriptInfo
 import os
-import zipfile
-from babel.messages.frontend import CommandLineInterface
-import sys
+from itertools import islice
+from typing import Iterator
 
 
-def get_script() -> tuple[builder.YabScriptBuilder | None, list[str]]:
+def get_cache_salt(line_ids: str, strict: bool) -> str:
+    # The story files of a strict build are validated, the ones of other builds are not
+    return f'{line_ids}:strict' if strict else line_ids
+
+
+def get_script(
+    use_cache: bool = True,
+    jobs: int = 1,
+    line_ids: str = 'uuid',
+    build_cache: BuildCache | None = None,
+    media_dry_run: bool = False,
+    strict: bool = False,
+) -> tuple[builder.YabScriptBuilder | None, list[str]]:
     structure_errors = checker.check_structure()
     if structure_errors:
         return None, structure_errors
 
-    paths = []
+    paths: list[str | os.PathLike] = []
     errors = []
-    for file in os.listdir(config.STORY_PATH):
+    for file in sorted(os.listdir(config.STORY_PATH)):
         if file.endswith('.yarn'):
             paths.append(os.path.join(config.STORY_PATH, file))
     if not paths:
@@ -23,79 +37,115 @@ def get_script() -> tuple[builder.YabScriptBuilder | None, list[str]]:
     if errors:
         return None, errors
 
-    script = builder.YabScriptBuilder(paths, config.SETTINGS_PATH)
+    if build_cache is None and use_cache:
+        build_cache = BuildCache(salt=get_cache_salt(line_ids, strict))
+        if os.path.isdir(config.OLD_BUILD_CACHE_PATH):
+            config.logger.warning(
+                f'The {config.OLD_BUILD_CACHE_PATH} folder is no longer used, remove it and do not commit it.'
+            )
+    script = builder.YabScriptBuilder(
+        paths,
+        config.SETTINGS_PATH,
+        build_cache=build_cache,
+        jobs=jobs,
+        line_ids=line_ids,
+        media_dry_run=media_dry_run,
+        strict=strict,
+    )
     errors += script.error_rows
     return script, errors
 
 
-def update_translation(native_lang: str):
-    with open('babel.cfg', 'w') as f:
-        f.write(config.BABEL_CFG)
-
-    os.path.isdir(config.TRANSLATION_PATH) or os.mkdir(config.TRANSLATION_PATH)
-    cli = CommandLineInterface()
-    sys.argv = [
-        'pybabel', 'extract',
-        '-F', 'babel.cfg',  # ваш конфигурационный файл
-        '-o', os.path.join(config.TRANSLATION_PATH, 'messages.pot'),  # выходной файл
-        '.'
-    ]
-    cli.run(sys.argv)
-    for lang in set(config.SUPPORTED_LANGUAGES) - {native_lang}:
-        if not os.path.isdir(os.path.join(config.TRANSLATION_PATH, lang)):
-            sys.argv = [
-                'pybabel', 'init',
-                '-i', os.path.join(config.TRANSLATION_PATH, 'messages.pot'),
-                '-d', os.path.join(config.TRANSLATION_PATH),
-                '-l', lang
-            ]
-            cli.run(sys.argv)
-    sys.argv = [
-        'pybabel', 'update',
-        '-i', os.path.join(config.TRANSLATION_PATH, 'messages.pot'),
-        '-d', os.path.join(config.TRANSLATION_PATH),
-    ]
-    cli.run(sys.argv)
-    sys.argv = [
-        'pybabel', 'compile',
-        '-d', os.path.join(config.TRANSLATION_PATH),
-    ]
-    cli.run(sys.argv)
-
-    os.remove('babel.cfg')
-
-
-def build():
-    config.logger.info('Building the project.')
-    script, errors = get_script()
-    if errors:
-        for error in errors:
-            config.logger.error(error)
-        return
-
-    with open('script.json', 'w') as f:
-        f.write(script.seriliazed_tg_script.model_dump_json())
-
-    update_translation(script.settings.default_settings.native_language)
-
-    with zipfile.ZipFile(config.BUILD_PATH, 'w') as z:
-        for file in os.listdir(config.MEDIA_PATH):
-            z.write(os.path.join(config.MEDIA_PATH, file), os.path.join('Media', file))
-        for root, _, files in os.walk(config.TRANSLATION_PATH):
-            for file in files:
-                file_path = os.path.join(root, file)
-                z.write(file_path, file_path)
-        z.write('script.json', 'script.json')
-
-    os.remove('script.json')
-
+def write_build(
+    script: builder.YabScriptBuilder,
+    script_json: str,
+    translate: bool = True,
+    binary_script: bool = False,
+    linked_script: bool = False,
+):
+    '''
+    Pack the media, the translations and the script into build.yab, reusing the unchanged media of the last build.
+    The translations are updated from the script unless `translate` is False.
+    With `binary_script` the binary encoding of the script is packed next to script.json,
+    with `linked_script` the encoding with the links resolved to positions.
+    '''
+    if translate:
+        with profiling.stage('translation'):
+            translation.update_translations(
+                script.seriliazed_tg_script,
+                script.settings.default_settings.native_language,
+            )
+
+    with profiling.stage('encode'):
+        entries = packager.get_build_entries(
+            script_json.encode('utf-8'),
+            dump_script(script.seriliazed_tg_script) if binary_script else None,
+            dump_linked_script(script.seriliazed_tg_script) if linked_script else None,
+        )
+    with profiling.stage('zip'):
+        packager.write_archive(config.BUILD_PATH, entries)
+
+
+def write_build_info(script: builder.YabScriptBuilder):
     with open(config.BUILD_INFO_PATH, 'w') as f:
         f.write(ScriptInfo(
             start_node_name=script.seriliazed_tg_script.start_node,
             all_node_names=list(script.seriliazed_tg_script.nodes.keys()),
-            availble_paths=script.paths,
+            node_links={node_name: sorted(node_links) for node_name, node_links in script.graph.items()},
         ).model_dump_json())
-    config.logger.info('Successfully built the project.')
+
+
+def build(
+    use_cache: bool = True,
+    jobs: int = 1,
+    line_ids: str = 'uuid',
+    media_dry_run: bool = False,
+    binary_script: bool = False,
+    linked_script: bool = False,
+    strict: bool = False,
+    profile: bool = False,
+    profile_stats: bool = False,
+):
+    '''
+    Build the project into build.yab. With `profile` the times and memory of the build stages
+    are written to build_profile.json, with `profile_stats` the cProfile stats to build_profile.pstats.
+    '''
+    with profiling.profile_build(
+        config.PROFILE_PATH if profile else None,
+        config.PROFILE_STATS_PATH if profile_stats else None,
+    ):
+        config.logger.info('Building the project.')
+        script, errors = get_script(use_cache, jobs, line_ids, media_dry_run=media_dry_run, strict=strict)
+        if errors or script is None:
+            for error in errors:
+                config.logger.error(error)
+            return
+
+        with profiling.stage('json'):
+            script_json = script.seriliazed_tg_script.model_dump_json()
+        write_build(script, script_json, binary_script=binary_script, linked_script=linked_script)
+        with profiling.stage('build info'):
+            write_build_info(script)
+        config.logger.info('Successfully built the project.')
+
+
+def iter_paths(limit: int | None = None) -> Iterator[list[str]]:
+    '''
+    Yield the paths through the last built script, at most `limit` of them.
+    The paths are made from the jump graph in build_info.json one at a time.
+    '''
+    with open(config.BUILD_INFO_PATH, 'r') as f:
+        script_info = ScriptInfo.model_validate_json(f.read())
+    node_links = {node_name: set(links) for node_name, links in script_info.node_links.items()}
+    return islice(graph.iter_paths(node_links, script_info.start_node_name), limit)
+
+
+def print_paths(limit: int | None = None):
+    if not os.path.exists(config.BUILD_INFO_PATH):
+        config.logger.error(f'The path {config.BUILD_INFO_PATH} does not exist. Build the project first.')
+        return
+    for path in iter_paths(limit):
+        print(' -> '.join(path))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,101 @@
+import functools
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from mimetypes import guess_type
+
+from yab_parser import config
+
+if sys.platform != 'win32':
+    import fcntl
+
+# The Linux ioctl that makes a copy-on-write clone of a file on btrfs, xfs and the like
+FICLONE = 0x40049409
+EXAMPLE_MEDIA_PATHS: dict[str | None, str] = {
+    'image/jpeg': config.EXAMPLE_JPG_PATH,
+    'image/png': config.EXAMPLE_PNG_PATH,
+    'audio/ogg': config.EXAMPLE_OOG_PATH,
+    'video/mp4': config.EXAMPLE_MP4_PATH,
+    'video/quicktime': config.EXAMPLE_MOV_PATH,
+}
+
+# Cleared on the first failed clone, the other placeholders are written right away
+_can_clone = sys.platform != 'win32'
+
+
+@functools.cache
+def get_example_content(media_type: str | None) -> bytes:
+    '''
+    Return the content of the placeholder of a media type, read once per process.
+    '''
+    example_path = EXAMPLE_MEDIA_PATHS.get(media_type)
+    if not example_path:
+        return b''
+    with open(example_path, 'rb') as f:
+        return f.read()
+
+
+def _clone(example_path: str, f) -> bool:
+    global _can_clone
+    if not _can_clone:
+        return False
+    try:
+        with open(example_path, 'rb') as example:
+            fcntl.ioctl(f.fileno(), FICLONE, example.fileno())
+    except OSError:
+        _can_clone = False
+        return False
+    return True
+
+
+def write_placeholder(path: str) -> bool:
+    '''
+    Write the example media of the type of the path into it and return True if it was cloned.
+    A clone shares the blocks of the example until one of them is changed.
+    Hard links are not used: a media file copied over a placeholder in place
+    would change the example and every other placeholder linked to it.
+    '''
+    media_type = guess_type(path)[0]
+    example_path = EXAMPLE_MEDIA_PATHS.get(media_type)
+    with open(path, 'wb') as f:
+        if example_path and _clone(example_path, f):
+            return True
+        f.write(get_example_content(media_type))
+    return False
+
+
+def sync_media(
+    used_media: set[str],
+    media_path: str = config.MEDIA_PATH,
+    dry_run: bool = False,
+) -> tuple[list[str], list[str]]:
+    '''
+    Write a placeholder for every media the script uses that is not in the media folder
+    and remove the files the script does not use. Return the created and the removed names.
+    With `dry_run` only report what would be done.
+    '''
+    exist_media = {entry.name for entry in os.scandir(media_path) if entry.is_file()}
+    new_media = sorted(used_media - exist_media)
+    for_deletion = sorted(exist_media - used_media)
+
+    if dry_run:
+        for media in for_deletion:
+            config.logger.info(f'Would remove the unused media {media}.')
+        config.logger.info(
+            f'Media: would create {len(new_media)} placeholders and remove {len(for_deletion)} unused files,'
+            f' {len(used_media)} media are used.'
+        )
+        return new_media, for_deletion
+    if not new_media and not for_deletion:
+        return new_media, for_deletion
+
+    with ThreadPoolExecutor() as executor:
+        removed = executor.map(os.remove, (os.path.join(media_path, media) for media in for_deletion))
+        cloned = executor.map(write_placeholder, (os.path.join(media_path, media) for media in new_media))
+        list(removed)
+        cloned_count = sum(cloned)
+    config.logger.info(
+        f'Media: created {len(new_media)} placeholders ({cloned_count} cloned)'
+        f' and removed {len(for_deletion)} unused files, {len(used_media)} media are used.'
+    )
+    return new_media, for_deletion
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import zipfile
+from typing import IO
+
+from yab_parser import config
+from yab_parser.binary_script import BINARY_SCRIPT_NAME
+from yab_parser.linked_script import LINKED_SCRIPT_NAME
+from yab_parser.cache import get_build_cache_path, get_digest
+from yab_parser.files import open_atomic
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+HASH_CACHE_NAME = 'file_hashes.json'
+# Compressing these again only costs time
+STORED_EXTENSIONS = {
+    '.jpeg', '.jpg', '.png', '.gif', '.webp',
+    '.ogg', '.oga', '.opus', '.mp3', '.m4a',
+    '.mp4', '.mov', '.webm', '.zip',
+}
+# A fixed date keeps the archive the same for the same content
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# An archive entry: its name and the path of the file or the content itself
+Entry = tuple[str, str | bytes]
+
+
+def get_compress_type(arcname: str) -> int:
+    # The binary script is stored to be mapped into memory straight from the archive
+    if arcname == BINARY_SCRIPT_NAME or os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class FileHashes():
+    '''
+    Content hashes of files, kept in the build cache by modification time and size
+    so that only the files changed since the last build are read.
+    '''
+    def __init__(self, cache_path: str | os.PathLike | None = None):
+        self.path = os.path.join(cache_path or get_build_cache_path(), HASH_CACHE_NAME)
+        # The mtime in nanoseconds, the size and the digest of every path
+        self._old_hashes: dict[str, list] = {}
+        self._hashes: dict[str, list] = {}
+        try:
+            with open(self.path, 'r') as f:
+                self._old_hashes = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            config.logger.warning(f'The file hash cache {self.path} is broken: {e}')
+
+    def get(self, path: str) -> str:
+        stat = os.stat(path)
+        cached = self._old_hashes.get(path)
+        if cached and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+            digest = cached[2]
+        else:
+            with open(path, 'rb') as f:
+                digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        self._hashes[path] = [stat.st_mtime_ns, stat.st_size, digest]
+        return digest
+
+    def save(self):
+        '''
+        Write the hashes of the files asked for since the cache was loaded, the others are dropped.
+        '''
+        if self._hashes == self._old_hashes:
+            return
+        with open_atomic(self.path, 'w') as f:
+            json.dump(self._hashes, f)
+
+
+def get_manifest(entries: list[Entry], file_hashes: FileHashes) -> dict[str, str]:
+    return {
+        arcname: get_digest(source) if isinstance(source, bytes) else file_hashes.get(source)
+        for arcname, source in entries
+    }
+
+
+def _copy_data(src: IO[bytes], dst: IO[bytes]):
+    # What shutil.copyfileobj does, its types do not take the files of ZipFile.open
+    chunk = src.read(COPY_BUFFER_SIZE)
+    while chunk:
+        dst.write(chunk)
+        chunk = src.read(COPY_BUFFER_SIZE)
+
+
+def _write_entry(z: zipfile.ZipFile, arcname: str, source: str | bytes):
+    info = zipfile.ZipInfo(arcname, date_time=ZIP_DATE_TIME)
+    info.compress_type = get_compress_type(arcname)
+    info.external_attr = 0o644 << 16
+    if isinstance(source, bytes):
+        z.writestr(info, source)
+        return
+    # The size tells the zip file if it needs the zip64 extension
+    info.file_size = os.path.getsize(source)
+    with open(source, 'rb') as src, z.open(info, 'w') as dst:
+        _copy_data(src, dst)
+
+
+def _get_reused_count(archive_path: str, entries: list[Entry], manifest: dict[str, str]) -> int:
+    '''
+    Return how many entries at the start of the archive have the same name, content
+    and compression as the new ones and can be kept where they are.
+    '''
+    try:
+        with zipfile.ZipFile(archive_path, 'r') as z:
+            old_manifest = json.loads(z.read(MANIFEST_NAME))
+            infos = z.infolist()
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return 0
+    if old_manifest.get('version') != MANIFEST_VERSION:
+        return 0
+    old_hashes = old_manifest.get('files', {})
+    count = 0
+    offset = -1
+    for info, (arcname, _) in zip(infos, entries):
+        if (
+            info.filename != arcname
+            or info.header_offset <= offset
+            or info.compress_type != get_compress_type(arcname)
+            or old_hashes.get(arcname) != manifest[arcname]
+        ):
+            break
+        offset = info.header_offset
+        count += 1
+    return count
+
+
+def _copy_entry(old_z: zipfile.ZipFile, z: zipfile.ZipFile, old_info: zipfile.ZipInfo):
+    # Stored entries, the big media, are copied byte for byte
+    info = zipfile.ZipInfo(old_info.filename, date_time=ZIP_DATE_TIME)
+    info.compress_type = old_info.compress_type
+    info.external_attr = old_info.external_attr
+    info.file_size = old_info.file_size
+    with old_z.open(old_info) as src, z.open(info, 'w') as dst:
+        _copy_data(src, dst)
+
+
+def _write_entries(archive_path: str, entries: list[Entry], reused: int = 0):
+    '''
+    Write the archive into a temporary file that replaces it at the end,
+    the first `reused` entries are copied from the previous archive.
+    '''
+    with open_atomic(archive_path) as f, zipfile.ZipFile(f, 'w') as z:
+        if reused:
+            with zipfile.ZipFile(archive_path, 'r') as old_z:
+                for old_info in old_z.infolist()[:reused]:
+                    _copy_entry(old_z, z, old_info)
+        for arcname, source in entries[reused:]:
+            _write_entry(z, arcname, source)
+
+
+def write_archive(
+    archive_path: str,
+    entries: list[Entry],
+    cache_path: str | os.PathLike | None = None,
+):
+    '''
+    Write the entries and a manifest of their hashes into the archive.
+    The entries at the start of the previous archive that did not change are copied from it
+    instead of being read and compressed again, so put the big entries that rarely change first.
+    The previous archive stays in place until the new one is complete.
+    '''
+    file_hashes = FileHashes(cache_path)
+    manifest = get_manifest(entries, file_hashes)
+    file_hashes.save()
+    reused = _get_reused_count(archive_path, entries, manifest) if os.path.exists(archive_path) else 0
+    entries = entries + [(MANIFEST_NAME, json.dumps(
+        {'version': MANIFEST_VERSION, 'files': manifest},
+        indent=2,
+    ).encode('utf-8'))]
+    if reused:
+        try:
+            _write_entries(archive_path, entries, reused)
+            config.logger.info(f'Reused {reused} of {len(entries)} entries of {archive_path}.')
+            return
+        except (OSError, zipfile.BadZipFile) as e:
+            config.logger.warning(f'Could not reuse the entries of {archive_path}, writing it again: {e}')
+    _write_entries(archive_path, entries)
+
+
+def get_build_entries(
+    script: str | bytes,
+    binary_script: bytes | None = None,
+    linked_script: bytes | None = None,
+) -> list[Entry]:
+    '''
+    Return the entries of build.yab: the media sorted by name, the translations,
+    the script and its binary and linked encodings if there are ones.
+    '''
+    entries: list[Entry] = []
+    if os.path.isdir(config.MEDIA_PATH):
+        for entry in sorted(os.scandir(config.MEDIA_PATH), key=lambda entry: entry.name):
+            if entry.is_file():
+                entries.append((f'Media/{entry.name}', entry.path))
+    translation_paths = []
+    for root, _, files in os.walk(config.TRANSLATION_PATH):
+        for file in files:
+            translation_paths.append(os.path.join(root, file))
+    for path in sorted(translation_paths):
+        entries.append((path.replace(os.sep, '/'), path))
+    entries.append(('script.json', script))
+    if binary_script is not None:
+        entries.append((BINARY_SCRIPT_NAME, binary_script))
+    if linked_script is not None:
+        entries.append((LINKED_SCRIPT_NAME, linked_script))
+    return entries
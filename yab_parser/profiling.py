@@ -0,0 +1,171 @@
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from yab_parser import config
+
+# The stages of one story file in the order they run, the node stages run once per node
+FILE_STAGES = ['ident', 'parse', 'facts', 'transform', 'serialize']
+NODE_STAGES = ['facts', 'transform', 'serialize']
+
+Clock = tuple[float, float]
+Timing = dict[str, float]
+
+
+def get_clock() -> Clock:
+    return time.perf_counter(), time.process_time()
+
+
+def get_timing(start: Clock) -> Timing:
+    '''
+    Return the wall and CPU seconds since `start`, a value of get_clock().
+    '''
+    wall, cpu = get_clock()
+    return {'wall': wall - start[0], 'cpu': cpu - start[1]}
+
+
+def sum_timings(timings: list[Timing]) -> Timing:
+    return {
+        'wall': sum(timing['wall'] for timing in timings),
+        'cpu': sum(timing['cpu'] for timing in timings),
+    }
+
+
+class BuildProfiler():
+    '''
+    The wall time, CPU time and peak memory of the stages of a build, and the timings of its story files.
+    The peak memory of a stage is the most memory Python had allocated while it ran. It is traced
+    with tracemalloc, so the times of a profiled build are longer than the ones of a normal build.
+    The story files parsed in worker processes only have their times.
+    '''
+    def __init__(self):
+        self.stages = []
+        self.story_files = []
+        self.total = {}
+        # The stage lists and the peak memory of the open stages, the build itself first
+        self._open_stages = [self.stages]
+        self._peaks = [0]
+        self._start = get_clock()
+        tracemalloc.start()
+
+    def _take_peak(self):
+        # tracemalloc keeps a single peak, it is moved to the innermost open stage
+        self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        record: dict[str, Any] = {'name': name}
+        self._open_stages[-1].append(record)
+        self._take_peak()
+        self._open_stages.append([])
+        self._peaks.append(0)
+        start = get_clock()
+        try:
+            yield
+        finally:
+            record.update(get_timing(start))
+            self._take_peak()
+            record['peak_memory'] = self._peaks.pop()
+            self._peaks[-1] = max(self._peaks[-1], record['peak_memory'])
+            stages = self._open_stages.pop()
+            if stages:
+                record['stages'] = stages
+
+    def add_story_file(self, story_file, cached: bool):
+        self.story_files.append((story_file, cached))
+
+    def stop(self):
+        self.total = get_timing(self._start)
+        self._take_peak()
+        self.total['peak_memory'] = self._peaks[0]
+        tracemalloc.stop()
+
+    def get_report(self) -> dict:
+        files = [self._get_file_report(story_file, cached) for story_file, cached in self.story_files]
+        compiled_files = [file for file in files if not file['cached']]
+        return {
+            'total': self.total,
+            'stages': self.stages,
+            'story_stages': {
+                name: sum_timings([file['stages'][name] for file in compiled_files if name in file['stages']])
+                for name in FILE_STAGES
+            },
+            'files': sorted(files, key=lambda file: file['wall'], reverse=True),
+        }
+
+    def _get_file_report(self, story_file, cached: bool) -> dict:
+        timings = story_file.timings
+        nodes = []
+        for node_name, node_timings in story_file.node_timings.items():
+            node_stages = {name: node_timings[name] for name in NODE_STAGES if name in node_timings}
+            nodes.append({
+                'name': node_name,
+                'lines': len(story_file.nodes[node_name].flow) if node_name in story_file.nodes else 0,
+                **sum_timings(list(node_stages.values())),
+                'stages': node_stages,
+            })
+        return {
+            'path': str(story_file.path),
+            # The times of a cached file are the ones of the build that compiled it
+            'cached': cached,
+            **sum_timings([timings[name] for name in FILE_STAGES if name in timings]),
+            'stages': {name: timings[name] for name in FILE_STAGES if name in timings},
+            'nodes': sorted(nodes, key=lambda node: node['wall'], reverse=True),
+        }
+
+
+_profiler: BuildProfiler | None = None
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    '''
+    Record the stage with the profiler of the running build, if the build is profiled.
+    '''
+    if _profiler is None:
+        yield
+        return
+    with _profiler.stage(name):
+        yield
+
+
+def add_story_file(story_file, cached: bool = False):
+    if _profiler is not None:
+        _profiler.add_story_file(story_file, cached)
+
+
+@contextmanager
+def profile_build(report_path: str | None = None, stats_path: str | None = None) -> Iterator[None]:
+    '''
+    Profile the build run in the block: write the report of its stages as JSON to `report_path`
+    and the cProfile stats of the main process to `stats_path`. Nothing is recorded without them.
+    '''
+    global _profiler
+    if report_path is None and stats_path is None:
+        yield
+        return
+    _profiler = BuildProfiler() if report_path else None
+    stats_profile = cProfile.Profile() if stats_path else None
+    if stats_profile:
+        stats_profile.enable()
+    try:
+        yield
+    finally:
+        if stats_profile and stats_path:
+            stats_profile.disable()
+            stats_profile.dump_stats(stats_path)
+            config.logger.info(f'Wrote the cProfile stats of the build to {stats_path}.')
+        if _profiler and report_path:
+            _profiler.stop()
+            report = _profiler.get_report()
+            _profiler = None
+            with open(report_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            config.logger.info(f'Wrote the build profile to {report_path}.')
+            if report['files']:
+                slowest = report['files'][0]
+                config.logger.info(f'The slowest story file is {slowest["path"]}: {slowest["wall"]:.2f} s.')
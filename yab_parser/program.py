@@ -0,0 +1,211 @@
+import operator
+from functools import reduce
+from typing import Any, Callable, cast
+
+from yab_parser.schemas.script import (
+    Condition,
+    ConditionType,
+    Expression,
+    ExpressionType,
+    Instruction,
+    Var,
+)
+
+# A program is a flat list of [opcode, argument] instructions for a stack machine.
+# push and load put a literal or a variable on the stack, the other opcodes
+# replace the number of values given by the argument with their result.
+PUSH = 'push'
+LOAD = 'load'
+ADD = 'add'
+SUBTRACT = 'subtract'
+MULTIPLY = 'multiply'
+DIVIDE = 'divide'
+MODULO = 'modulo'
+EQ = '=='
+NE = '!='
+LT = '<'
+GT = '>'
+LE = '<='
+GE = '>='
+NOT = 'not'
+AND = 'and'
+OR = 'or'
+XOR = 'xor'
+
+Variables = dict[str, Any]
+Evaluator = Callable[[Variables], Any]
+# How the instructions are read, the argument of an operation is the number of its operands
+Code = list[tuple[str, Any]]
+
+EXPRESSION_OPCODES = {
+    ExpressionType.add: ADD,
+    ExpressionType.subtract: SUBTRACT,
+    ExpressionType.multiply: MULTIPLY,
+    ExpressionType.divide: DIVIDE,
+    ExpressionType.modulo: MODULO,
+}
+CONDITION_OPCODES = {
+    ConditionType.eq: EQ,
+    ConditionType.ne: NE,
+    ConditionType.lt: LT,
+    ConditionType.gt: GT,
+    ConditionType.le: LE,
+    ConditionType.ge: GE,
+    ConditionType.not_op: NOT,
+    ConditionType.and_op: AND,
+    ConditionType.or_op: OR,
+    ConditionType.xor_op: XOR,
+}
+# Folded from left to right
+ARITHMETIC_OPERATORS = {
+    ADD: operator.add,
+    SUBTRACT: operator.sub,
+    MULTIPLY: operator.mul,
+    DIVIDE: operator.truediv,
+    MODULO: operator.mod,
+}
+COMPARISON_OPERATORS = {
+    EQ: operator.eq,
+    NE: operator.ne,
+    LT: operator.lt,
+    GT: operator.gt,
+    LE: operator.le,
+    GE: operator.ge,
+}
+# The logical opcodes take any number of operands, nested ones are merged
+LOGICAL_OPCODES = {AND, OR, XOR}
+
+
+def _xor(values) -> bool:
+    return sum(map(bool, values)) % 2 == 1
+
+
+def _apply(opcode: str, values: list):
+    if opcode in ARITHMETIC_OPERATORS:
+        return reduce(ARITHMETIC_OPERATORS[opcode], values)
+    if opcode in COMPARISON_OPERATORS:
+        return COMPARISON_OPERATORS[opcode](*values)
+    if opcode == NOT:
+        return not values[0]
+    if opcode == AND:
+        return all(values)
+    if opcode == OR:
+        return any(values)
+    if opcode == XOR:
+        return _xor(values)
+    raise ValueError(f'Unknown opcode {opcode}.')
+
+
+def _get_operands(value) -> tuple[str, list]:
+    if isinstance(value, Condition):
+        return CONDITION_OPCODES[value.cond_type], value.value
+    return EXPRESSION_OPCODES[value.exp_type], value.value
+
+
+def _is_constant(program: list[Instruction]) -> bool:
+    return len(program) == 1 and program[0][0] == PUSH
+
+
+def _compile_logical(opcode: str, programs: list[list[Instruction]]) -> list[Instruction]:
+    operands = []
+    constants = []
+    for program in programs:
+        if program[-1][0] == opcode:
+            # a and (b and c) is a and b and c, the grammar nests the chains to the right
+            operands.extend(_split(program[:-1], cast(int, program[-1][1])))
+        elif _is_constant(program):
+            constants.append(program[0][1])
+        else:
+            operands.append(program)
+    if opcode == AND and not all(constants) or opcode == OR and any(constants):
+        return [[PUSH, opcode == OR]]
+    if opcode == XOR and _xor(constants):
+        # An odd number of true constants flips the result of the rest
+        operands.append([[PUSH, True]])
+    if len(operands) <= 1 and all(_is_constant(operand) for operand in operands):
+        return [[PUSH, _apply(opcode, [operand[0][1] for operand in operands])]]
+    return [instruction for operand in operands for instruction in operand] + [[opcode, len(operands)]]
+
+
+def _split(program: list[Instruction], count: int) -> list[list[Instruction]]:
+    '''
+    Split the code of the operands of the last instruction into one program per operand.
+    '''
+    programs = []
+    end = len(program)
+    for _ in range(count):
+        depth = 1
+        start = end
+        while depth:
+            start -= 1
+            opcode, argument = cast(Code, program)[start]
+            depth += -1 if opcode in (PUSH, LOAD) else argument - 1
+        programs.append(program[start:end])
+        end = start
+    return programs[::-1]
+
+
+def compile_program(value) -> list[Instruction]:
+    '''
+    Lower a condition, an expression, a variable or a literal to a program.
+    The operations on literals only are done here and the result is pushed instead.
+    '''
+    if isinstance(value, Var):
+        return [[LOAD, value.name]]
+    if not isinstance(value, (Condition, Expression)):
+        return [[PUSH, value]]
+    opcode, operands = _get_operands(value)
+    programs = [compile_program(operand) for operand in operands]
+    if opcode in LOGICAL_OPCODES:
+        return _compile_logical(opcode, programs)
+    program = [instruction for operand in programs for instruction in operand] + [[opcode, len(programs)]]
+    if all(_is_constant(operand) for operand in programs):
+        try:
+            return [[PUSH, evaluate(program, {})]]
+        except (ArithmeticError, TypeError):
+            # Left to fail at runtime like the rest of the script would
+            pass
+    return program
+
+
+def evaluate(program: list[Instruction], variables: Variables):
+    stack: list = []
+    for opcode, argument in cast(Code, program):
+        if opcode == PUSH:
+            stack.append(argument)
+        elif opcode == LOAD:
+            stack.append(variables[argument])
+        else:
+            values = stack[-argument:]
+            del stack[-argument:]
+            stack.append(_apply(opcode, values))
+    return stack[-1]
+
+
+def _make_operation(opcode: str, operands: list[Evaluator]) -> Evaluator:
+    if opcode in COMPARISON_OPERATORS or opcode in ARITHMETIC_OPERATORS and len(operands) == 2:
+        function = COMPARISON_OPERATORS.get(opcode) or ARITHMETIC_OPERATORS[opcode]
+        first, second = operands
+        return lambda variables: function(first(variables), second(variables))
+    if opcode == NOT:
+        operand = operands[0]
+        return lambda variables: not operand(variables)
+    # Every operand is evaluated like evaluate() does, so both fail on the same missing variables
+    return lambda variables: _apply(opcode, [operand(variables) for operand in operands])
+
+
+def make_evaluator(program: list[Instruction]) -> Evaluator:
+    '''
+    Turn the program into nested closures, the same result as evaluate() without the dispatch on every call.
+    '''
+    stack: list[Callable] = []
+    for opcode, argument in cast(Code, program):
+        if opcode == PUSH:
+            stack.append(lambda variables, value=argument: value)
+        elif opcode == LOAD:
+            stack.append(operator.itemgetter(argument))
+        else:
+            operands = stack[-argument:]
+            del stack[-argument:]
+            stack.append(_make_operation(opcode, operands))
+    return stack[-1]
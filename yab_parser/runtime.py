@@ -0,0 +1,185 @@
+from typing import Any
+
+from yab_parser.program import Evaluator, Variables, compile_program, make_evaluator
+from yab_parser.schemas.script import (
+    Command,
+    CommandType,
+    FlowControl,
+    Instruction,
+    Message,
+    Script,
+    VariableCommand,
+)
+
+# A run that goes through this many lines without waiting for a choice is taken for an endless loop
+MAX_LINES_PER_RUN = 100_000
+
+# The kinds of the compiled lines
+SAY, DO, JUMP, SET, BRANCH = range(5)
+
+
+class ScriptRuntimeError(Exception):
+    pass
+
+
+def get_evaluator(program: list[Instruction] | None, value: Any) -> Evaluator:
+    '''
+    Return a function of the variables that runs the program of a condition or a calculation.
+    A script loaded from script.json only has the trees, they are compiled here.
+    '''
+    return make_evaluator(program or compile_program(value))
+
+
+def _render(text: str, variables: Variables) -> str:
+    # The builder escapes the braces of the text, the fields left are the variables like {$gold}
+    if '{' not in text:
+        return text
+    return text.format_map(variables)
+
+
+def compile_line(line):
+    '''
+    Return the line as a tuple of its kind and what is needed to run it.
+    '''
+    if isinstance(line, Message):
+        options = [
+            (
+                option,
+                get_evaluator(option.program, option.condition) if option.condition is not None else None,
+                option.link or line.next_line_id,
+            )
+            for option in line.options
+        ]
+        return SAY, line, options, line.next_line_id
+    if isinstance(line, VariableCommand):
+        if line.calculation:
+            evaluate = get_evaluator(line.program, line.calculation)
+        else:
+            evaluate = make_evaluator(compile_program(line.value))
+        return SET, line.name, evaluate, line.next_line_id
+    if isinstance(line, FlowControl):
+        blocks = []
+        for block in ([line.if_block] if line.if_block else []) + line.elif_blocks:
+            blocks.append((get_evaluator(block.program, block.condition), block.link or line.next_line_id))
+        else_link = (line.else_block.link or line.next_line_id) if line.else_block else line.next_line_id
+        return BRANCH, blocks, else_link, line.next_line_id
+    if isinstance(line, Command) and line.command_type == CommandType.jump:
+        return JUMP, line.args['node_name'], None, None
+    return DO, line, None, line.next_line_id
+
+
+class Step():
+    '''
+    A message or a command for the transport to send. The options are the texts of the options
+    the conditions let through, Session.choose takes the position of one of them.
+    '''
+    __slots__ = ('node_name', 'line_id', 'line', 'text', 'options')
+
+    def __init__(
+        self,
+        node_name: str,
+        line_id: str,
+        line,
+        text: str | None = None,
+        options: list[str] | None = None,
+    ):
+        self.node_name = node_name
+        self.line_id = line_id
+        self.line = line
+        self.text = text
+        self.options = options or []
+
+    def __repr__(self) -> str:
+        return f'Step({self.node_name!r}, {self.line_id!r}, text={self.text!r}, options={self.options!r})'
+
+
+class Runtime():
+    '''
+    Run sessions through a compiled script. The nodes are compiled on first use,
+    so the script may be a Script or a LazyScript.
+    '''
+    def __init__(self, script: Script):
+        self.script = script
+        self._nodes: dict[str, dict[str, tuple]] = {}
+
+    def get_lines(self, node_name: str) -> dict[str, tuple]:
+        lines = self._nodes.get(node_name)
+        if lines is None:
+            node = self.script.nodes[node_name]
+            lines = self._nodes[node_name] = {line_id: compile_line(line) for line_id, line in node.flow.items()}
+        return lines
+
+    def start(self, node_name: str | None = None, variables: Variables | None = None) -> 'Session':
+        return Session(self, node_name or self.script.start_node, variables)
+
+
+class Session():
+    '''
+    The state of one reader of the script: the variables and the current line.
+    run() returns the steps up to the next choice, choose() picks an option of the last step.
+    '''
+    def __init__(self, runtime: Runtime, node_name: str, variables: Variables | None = None):
+        self.runtime = runtime
+        self.variables = {} if variables is None else variables
+        self.node_name = node_name
+        # The flow of a node starts at the empty line id
+        self.line_id: str | None = ''
+        self.is_finished = False
+        self._links: list[str | None] | None = None
+
+    @property
+    def is_waiting(self) -> bool:
+        return self._links is not None
+
+    def choose(self, index: int):
+        if self._links is None:
+            raise ScriptRuntimeError('The session is not waiting for a choice.')
+        self.line_id = self._links[index]
+        self._links = None
+
+    def run(self) -> list[Step]:
+        if self._links is not None:
+            raise ScriptRuntimeError('The session is waiting for a choice.')
+        steps: list[Step] = []
+        variables = self.variables
+        lines = self.runtime.get_lines(self.node_name)
+        line_id = self.line_id
+        for _ in range(MAX_LINES_PER_RUN):
+            if line_id is None or line_id not in lines:
+                self.is_finished = True
+                self.line_id = None
+                return steps
+            kind, data, extra, next_line_id = lines[line_id]
+            if kind == SAY:
+                options: list[str] = []
+                links = []
+                for option, condition, link in extra:
+                    if condition is None or condition(variables):
+                        options.append(_render(option.text, variables))
+                        links.append(link)
+                text = _render(data.text, variables) if data.text is not None else None
+                steps.append(Step(self.node_name, line_id, data, text, options))
+                if links:
+                    self._links = links
+                    self.line_id = None
+                    return steps
+                line_id = next_line_id
+            elif kind == SET:
+                variables[data] = extra(variables)
+                line_id = next_line_id
+            elif kind == BRANCH:
+                line_id = extra
+                for condition, link in data:
+                    if condition(variables):
+                        line_id = link
+                        break
+            elif kind == JUMP:
+                self.node_name = data
+                lines = self.runtime.get_lines(data)
+                line_id = ''
+            else:
+                steps.append(Step(self.node_name, line_id, data))
+                line_id = next_line_id
+        raise ScriptRuntimeError(
+            f'The session ran {MAX_LINES_PER_RUN} lines without a choice in the node {self.node_name}.'
+        )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 from yab_parser.schemas.settings import ScriptSettings
 from enum import Enum
 from typing import Union
@@ -41,6 +41,7 @@ class ConditionType(str, Enum):
     and_op = 'and'
     or_op = 'or'
     not_op = 'not'
+    xor_op = 'xor'
     eq = '=='
     ne = '!='
     lt = '<'
@@ -49,6 +50,11 @@ class ConditionType(str, Enum):
     ge = '>='
 
 
+# An [opcode, argument] pair of a compiled condition or calculation, see yab_parser.program.
+# The programs are kept out of script.json, the binary and linked scripts store them.
+Instruction = list[bool | int | float | str | None]
+
+
 class Var(BaseModel):
     name: str
 
@@ -96,6 +102,7 @@ class Command(BaseModel):
 class Option(BaseModel):
     text: str
     condition: Condition | None = None
+    program: list[Instruction] | None = Field(default=None, exclude=True)
     link: str | None = None
 
     @field_validator('text')
@@ -125,6 +132,7 @@ class VariableCommand(BaseModel):
     name: str
     value: bool | int | float | str | None = None
     calculation: Expression | None = None
+    program: list[Instruction] | None = Field(default=None, exclude=True)
     next_line_id: str | None = None
 
     @field_validator('value')
@@ -151,6 +159,7 @@ class VariableCommand(BaseModel):
 
 class FlowControlElement(BaseModel):
     condition: Condition | None = None
+    program: list[Instruction] | None = Field(default=None, exclude=True)
     link: str | None = None
 
 
@@ -180,7 +189,7 @@ class Script(BaseModel):
 class ScriptInfo(BaseModel):
     start_node_name: str
     all_node_names: list[str]
-    availble_paths: list[list[str]]
+    node_links: dict[str, list[str]] = {}
 
 
 FlowType = Union[Message, Command, VariableCommand, FlowControl]
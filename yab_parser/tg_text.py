@@ -0,0 +1,141 @@
+import re
+from html.entities import html5
+
+
+# The same patterns html.parser uses to find character references in text.
+CHARREF = re.compile('&#(?:[0-9]+|[xX][0-9a-fA-F]+)[^0-9a-fA-F]')
+ENTITYREF = re.compile('&([a-zA-Z][-.a-zA-Z0-9]*)[^a-zA-Z0-9]')
+INCOMPLETE = re.compile('&[a-zA-Z#]')
+# BeautifulSoup collapses strings made only of these characters.
+ASCII_SPACES = str.maketrans('', '', ' \n\t\x0c\r')
+
+
+def _get_entities() -> dict[str, str]:
+    entities: dict[str, str] = {}
+    for name, character in sorted(html5.items()):
+        entities.setdefault(name.removesuffix(';'), character)
+    return entities
+
+
+ENTITIES = _get_entities()
+
+
+class TgTag:
+    '''
+    An html tag of the telegram markup, `name` is used to balance the tags.
+    '''
+    __slots__ = ('name', 'markup', 'is_closing')
+
+    def __init__(self, name: str, markup: str, is_closing: bool = False):
+        self.name = name
+        self.markup = markup
+        self.is_closing = is_closing
+
+
+def _decode_charref(name: str) -> str:
+    if name[0] in 'xX':
+        code = int(name[1:], 16)
+    else:
+        code = int(name)
+    if code < 256:
+        try:
+            return bytes([code]).decode('windows-1252')
+        except UnicodeDecodeError:
+            pass
+    try:
+        return chr(code)
+    except (ValueError, OverflowError):
+        return '\N{REPLACEMENT CHARACTER}'
+
+
+def _unescape(text: str, is_last: bool) -> str | None:
+    '''
+    Decode the character references of a text between two tags the way html.parser does.
+    Return None when html.parser would give up on the rest of the markup.
+    '''
+    raw_text = text if is_last else text + '<'
+    result = []
+    i = 0
+    while True:
+        j = text.find('&', i)
+        if j < 0:
+            result.append(text[i:])
+            return ''.join(result)
+        result.append(text[i:j])
+        if text.startswith('&#', j):
+            match = CHARREF.match(raw_text, j)
+            if not match:
+                return None
+            result.append(_decode_charref(match.group()[2:-1]))
+        else:
+            match = ENTITYREF.match(raw_text, j)
+            if not match:
+                if INCOMPLETE.match(raw_text, j):
+                    return None
+                result.append('&')
+                i = j + 1
+                continue
+            name = match.group(1)
+            result.append(ENTITIES.get(name, '&' + name))
+        i = match.end()
+        if raw_text[i - 1] != ';':
+            i -= 1
+
+
+def _escape(text: str) -> str:
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def _normalize_with_bs4(tokens: list[str | TgTag]) -> str:
+    from bs4 import BeautifulSoup
+
+    markup = ''.join(token.markup if isinstance(token, TgTag) else token for token in tokens)
+    return str(BeautifulSoup(markup, 'html.parser'))
+
+
+def normalize_tg_text(tokens: list[str | TgTag]) -> str:
+    '''
+    Join the text and tags into telegram html with balanced tags.
+    Unclosed tags are closed at the end, stray closing tags are dropped
+    and a closing tag closes every tag opened after its pair.
+    A text made only of whitespace becomes a single newline or space.
+    The result is the same as `str(BeautifulSoup(markup, 'html.parser'))`.
+    '''
+    result = []
+    open_tags = []
+    text_row = []
+    for token in tokens + [None]:
+        if isinstance(token, str):
+            text_row.append(token)
+            continue
+        if text_row:
+            text = ''.join(text_row)
+            text_row = []
+            if '&' in text:
+                unescaped = _unescape(text, is_last=token is None)
+                if unescaped is None:
+                    return _normalize_with_bs4(tokens)
+                text = unescaped
+            if text and not text.translate(ASCII_SPACES):
+                text = '\n' if '\n' in text else ' '
+            result.append(_escape(text))
+        if token is None:
+            break
+        if not token.is_closing:
+            open_tags.append(token)
+            result.append(token.markup)
+        elif any(open_tag.name == token.name for open_tag in open_tags):
+            while True:
+                open_tag = open_tags.pop()
+                result.append(f'</{open_tag.name}>')
+                if open_tag.name == token.name:
+                    break
+    for open_tag in reversed(open_tags):
+        result.append(f'</{open_tag.name}>')
+    return ''.join(result)
@@ -0,0 +1,105 @@
+import datetime
+import os
+from io import BytesIO
+
+from babel.messages.catalog import Catalog
+from babel.messages.mofile import write_mo
+from babel.messages.pofile import read_po, write_po
+from babel.util import LOCALTZ
+
+from yab_parser import config
+from yab_parser.files import write_atomic
+from yab_parser.babel_extractors import iter_script_messages
+from yab_parser.schemas.script import Script
+
+DOMAIN = 'messages'
+TEMPLATE_PATH = os.path.join(config.TRANSLATION_PATH, f'{DOMAIN}.pot')
+
+
+def get_template(script: Script) -> Catalog:
+    '''
+    Return the catalog of every translatable message of the script.
+    '''
+    template = Catalog()
+    for message, comments in iter_script_messages(script):
+        template.add(message, None, [('script.json', 0)], auto_comments=comments)
+    return template
+
+
+def _get_messages(catalog: Catalog) -> list[tuple]:
+    return [(message.id, message.context, tuple(message.auto_comments)) for message in catalog if message.id]
+
+
+def _read_catalog(path: str, locale: str | None = None) -> Catalog:
+    with open(path, 'rb') as f:
+        return read_po(f, locale=locale, domain=DOMAIN)
+
+
+def _write_catalog(path: str, catalog: Catalog):
+    buffer = BytesIO()
+    write_po(buffer, catalog, width=76)
+    write_atomic(path, buffer.getvalue())
+
+
+def _init_catalog(template: Catalog, locale: str) -> Catalog:
+    # read_po needs the locale to set the plural forms of the language
+    buffer = BytesIO()
+    write_po(buffer, template, width=76)
+    buffer.seek(0)
+    catalog = read_po(buffer, locale=locale, domain=DOMAIN)
+    catalog.revision_date = datetime.datetime.now(LOCALTZ)
+    catalog.fuzzy = False
+    return catalog
+
+
+def _compile_catalog(po_path: str, mo_path: str, locale: str):
+    catalog = _read_catalog(po_path, locale)
+    if catalog.fuzzy:
+        config.logger.info(f'The catalog {po_path} is marked as fuzzy, it is not compiled.')
+        return
+    for message, errors in catalog.check():
+        for error in errors:
+            config.logger.warning(f'{po_path}:{message.lineno}: {error}')
+    buffer = BytesIO()
+    write_mo(buffer, catalog)
+    write_atomic(mo_path, buffer.getvalue())
+    config.logger.info(f'Compiled the {locale} translation.')
+
+
+def get_locales(native_language: str) -> list[str]:
+    '''
+    Return the languages to translate into: the supported ones and those that already have a catalog.
+    '''
+    locales = set(config.SUPPORTED_LANGUAGES) - {native_language}
+    if os.path.isdir(config.TRANSLATION_PATH):
+        for locale in os.listdir(config.TRANSLATION_PATH):
+            if os.path.exists(os.path.join(config.TRANSLATION_PATH, locale, 'LC_MESSAGES', f'{DOMAIN}.po')):
+                locales.add(locale)
+    return sorted(locales)
+
+
+def update_translations(script: Script, native_language: str):
+    '''
+    Merge the messages of the script into the catalogs of Translation/ and compile them.
+    A catalog is rewritten only when the messages changed, and compiled only when its .po is newer than its .mo.
+    '''
+    template = get_template(script)
+    old_template = _read_catalog(TEMPLATE_PATH) if os.path.exists(TEMPLATE_PATH) else None
+    is_changed = old_template is None or _get_messages(old_template) != _get_messages(template)
+    if is_changed:
+        _write_catalog(TEMPLATE_PATH, template)
+
+    for locale in get_locales(native_language):
+        locale_path = os.path.join(config.TRANSLATION_PATH, locale, 'LC_MESSAGES')
+        po_path = os.path.join(locale_path, f'{DOMAIN}.po')
+        mo_path = os.path.join(locale_path, f'{DOMAIN}.mo')
+        if not os.path.exists(po_path):
+            _write_catalog(po_path, _init_catalog(template, locale))
+            config.logger.info(f'Created the {locale} translation catalog.')
+        elif is_changed:
+            catalog = _read_catalog(po_path, locale)
+            catalog.update(template)
+            _write_catalog(po_path, catalog)
+            config.logger.info(f'Updated the {locale} translation catalog.')
+        if not os.path.exists(mo_path) or os.path.getmtime(po_path) > os.path.getmtime(mo_path):
+            _compile_catalog(po_path, mo_path, locale)
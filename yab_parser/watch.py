@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from typing import Iterable
+
+from yab_parser import config, profiling
+from yab_parser.builder import YabScriptBuilder
+from yab_parser.cache import BuildCache, MemoryBuildCache
+from yab_parser.main import get_cache_salt, get_script, write_build, write_build_info
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+# Changes closer together than this are handled by one rebuild
+SETTLE_TIME = 0.1
+Snapshot = dict[str, tuple[int, int]]
+
+
+def get_snapshot() -> Snapshot:
+    '''
+    Return the modification time and size of every file the build reads.
+    '''
+    snapshot = {}
+    for dir_path, extension in ((config.STORY_PATH, '.yarn'), (config.MEDIA_PATH, '')):
+        if not os.path.isdir(dir_path):
+            continue
+        for entry in os.scandir(dir_path):
+            if entry.is_file() and entry.name.endswith(extension):
+                stat = entry.stat()
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    if os.path.exists(config.SETTINGS_PATH):
+        stat = os.stat(config.SETTINGS_PATH)
+        snapshot[config.SETTINGS_PATH] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def update_snapshot(snapshot: Snapshot, paths: Iterable[str]):
+    for path in paths:
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        else:
+            snapshot.pop(path, None)
+
+
+def get_changed_paths(old_snapshot: Snapshot, new_snapshot: Snapshot) -> set[str]:
+    return {
+        path for path in old_snapshot.keys() | new_snapshot.keys()
+        if old_snapshot.get(path) != new_snapshot.get(path)
+    }
+
+
+class ProjectWatcher():
+    '''
+    Rebuild the project on every change and keep everything that did not change in memory:
+    the compiled grammars, the parsed story files, the checks and the last script.
+    '''
+    def __init__(
+        self,
+        use_cache: bool = True,
+        jobs: int = 1,
+        line_ids: str = 'uuid',
+        interval: float = 0.5,
+        media_dry_run: bool = False,
+        binary_script: bool = False,
+        linked_script: bool = False,
+        strict: bool = False,
+        profile: bool = False,
+        profile_stats: bool = False,
+    ):
+        self.jobs = jobs
+        self.line_ids = line_ids
+        self.interval = interval
+        self.media_dry_run = media_dry_run
+        self.binary_script = binary_script
+        self.linked_script = linked_script
+        self.strict = strict
+        self.profile = profile
+        self.profile_stats = profile_stats
+        self.build_cache = MemoryBuildCache(
+            BuildCache(salt=get_cache_salt(line_ids, strict)) if use_cache else None
+        )
+        self.script: YabScriptBuilder | None = None
+        self.script_json: str | None = None
+        self._snapshot: Snapshot = {}
+        self._changed = threading.Event()
+
+    def run(self):
+        observer = self._start_observer()
+        if observer:
+            config.logger.info('Watching the project for changes.')
+        else:
+            config.logger.info(f'Watching the project for changes every {self.interval} s.')
+        try:
+            # Taken before the build, so the edits saved while it runs are seen by the next one
+            self._snapshot = get_snapshot()
+            self.rebuild()
+            while True:
+                self._wait(observer)
+                snapshot = get_snapshot()
+                changed_paths = get_changed_paths(self._snapshot, snapshot)
+                if not changed_paths:
+                    continue
+                config.logger.info(f'Changed: {", ".join(sorted(changed_paths))}.')
+                self._snapshot = snapshot
+                self.rebuild(changed_paths)
+        finally:
+            if observer:
+                observer.stop()
+                observer.join()
+
+    def rebuild(self, changed_paths: set[str] | None = None):
+        '''
+        Run the stages of the build the changed paths affect, every stage if `changed_paths` is None.
+        '''
+        with profiling.profile_build(
+            config.PROFILE_PATH if self.profile else None,
+            config.PROFILE_STATS_PATH if self.profile_stats else None,
+        ):
+            self._rebuild(changed_paths)
+
+    def _rebuild(self, changed_paths: set[str] | None):
+        start = time.perf_counter()
+        only_media = changed_paths is not None and all(
+            os.path.dirname(path) == config.MEDIA_PATH for path in changed_paths
+        )
+        if only_media and self.script:
+            with profiling.stage('media'):
+                update_snapshot(self._snapshot, self.script._add_media())
+        else:
+            script, errors = get_script(
+                jobs=self.jobs,
+                line_ids=self.line_ids,
+                build_cache=self.build_cache,
+                media_dry_run=self.media_dry_run,
+                strict=self.strict,
+            )
+            if script:
+                # The build adds idents and media placeholders, they are not changes of the writer
+                update_snapshot(self._snapshot, script.written_paths)
+            if errors or script is None:
+                for error in errors:
+                    config.logger.error(error)
+                self.script = None
+                return
+            self.script = script
+
+        with profiling.stage('json'):
+            script_json = self.script.seriliazed_tg_script.model_dump_json()
+        write_build(
+            self.script,
+            script_json,
+            translate=script_json != self.script_json,
+            binary_script=self.binary_script,
+            linked_script=self.linked_script,
+        )
+        with profiling.stage('build info'):
+            write_build_info(self.script)
+        self.script_json = script_json
+        config.logger.info(f'Rebuilt the project in {time.perf_counter() - start:.2f} s.')
+
+    def _wait(self, observer):
+        if not observer:
+            time.sleep(self.interval)
+            return
+        self._changed.wait()
+        time.sleep(SETTLE_TIME)
+        self._changed.clear()
+
+    def _start_observer(self):
+        if Observer is None:
+            return None
+        changed = self._changed
+
+        class ChangeHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                changed.set()
+
+        observer = Observer()
+        for path in (config.STORY_PATH, config.MEDIA_PATH, os.path.dirname(config.SETTINGS_PATH)):
+            if os.path.isdir(path):
+                observer.schedule(ChangeHandler(), path)
+        observer.start()
+        return observer
+
+
+def watch(
+    use_cache: bool = True,
+    jobs: int = 1,
+    line_ids: str = 'uuid',
+    interval: float = 0.5,
+    media_dry_run: bool = False,
+    binary_script: bool = False,
+    linked_script: bool = False,
+    strict: bool = False,
+    profile: bool = False,
+    profile_stats: bool = False,
+):
+    try:
+        ProjectWatcher(
+            use_cache,
+            jobs,
+            line_ids,
+            interval,
+            media_dry_run,
+            binary_script,
+            linked_script,
+            strict,
+            profile,
+            profile_stats,
+        ).run()
+    except KeyboardInterrupt:
+        config.logger.info('Stopped watching the project.')